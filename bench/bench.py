@@ -0,0 +1,246 @@
+import numpy as np
+import tracemalloc
+import importlib.util
+import argparse
+import resource
+import tempfile
+import json
+import time
+import sys
+import cv2
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+
+from modules.config import CYAN, GREEN, RED, YELLOW, RESET  # noqa: E402
+from modules import augments, transforms, dataset  # noqa: E402
+from synth import make_images, make_tree  # noqa: E402
+
+
+def has_tensorflow():
+    return importlib.util.find_spec("tensorflow") is not None
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(fn, calls, per_call):
+    """
+    Times 'calls' runs of fn (after one warm-up), then re-runs it once
+    under tracemalloc for the peak allocation, so tracing never skews
+    the latencies.
+    """
+    fn()
+    lat = []
+    start = time.perf_counter()
+    for _ in range(calls):
+        t = time.perf_counter()
+        fn()
+        lat.append((time.perf_counter() - t) * 1000)
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "images_per_s": calls * per_call / total if total else 0.0,
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p90_ms": float(np.percentile(lat, 90)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "peak_alloc_mb": peak / 2**20,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def per_image(func, imgs):
+    it = iter(())
+
+    def step():
+        nonlocal it
+        img = next(it, None)
+        if img is None:
+            it = iter(imgs)
+            img = next(it)
+        func(img)
+    return step
+
+
+def stages(imgs, work, repeat):
+    """name -> (setup returning (fn, calls, images per call)) or skip."""
+    out = {}
+    n = len(imgs)
+    calls = n * repeat
+    for func, name in augments.AvailableTransforms:
+        out[f"augments.{name}"] = lambda f=func: (per_image(f, imgs), calls, 1)
+    out["augments.transform"] = \
+        lambda: (lambda: augments.transform(imgs), repeat, n)
+    batch = np.stack([cv2.resize(i, (128, 128)) for i in imgs])
+    out["augments.test_views"] = \
+        lambda: (lambda: augments.test_views(batch, 8), repeat, 8 * n)
+
+    for key, func in transforms.Operations.items():
+        label = key.replace(" ", "_")
+        out[f"transforms.{label}"] = \
+            lambda f=func: (per_image(f, imgs), calls, 1)
+    ops = transforms.select_ops()
+    out["transforms.transform_one"] = \
+        lambda: (per_image(lambda i: transforms.transform_one(i, ops), imgs),
+                 calls, 1)
+
+    def balance():
+        paths = make_tree(os.path.join(work, "balance"), n // 4, split=False)
+        train_dir = os.path.dirname(paths[0])
+        cls = [p for p in paths if os.path.dirname(p) == train_dir]
+        return (lambda: dataset.balance_directory(
+            cls, train_dir, 2 * len(cls), seed=0), repeat, len(cls))
+    out["dataset.balance_directory"] = balance
+
+    def stream_files():
+        import Transformation
+        from modules.writer import OutputWriter
+        src = os.path.join(work, "save_src")
+        paths = make_tree(src, 4, split=False)
+        dst = os.path.join(work, "save_dst")
+        return (lambda: Transformation.stream_files(
+            paths, None, dst, src, OutputWriter(), force=True
+        ), repeat, len(paths))
+    out["Transformation.stream_files"] = stream_files
+
+    if not has_tensorflow():
+        out["predict.predict_images"] = "tensorflow not installed"
+        out["predict.predict_probs_tta8"] = "tensorflow not installed"
+        out["train.getData"] = "tensorflow not installed"
+        return out
+
+    def predict_images():
+        import tensorflow as tf
+        import predict
+        import train
+        from keras import models, layers
+        train.models, train.layers, train.tf, predict.tf = \
+            models, layers, tf, tf
+        predict.vis_predictions = lambda *a: None
+        model = train.create_model(4)
+        paths = make_tree(os.path.join(work, "predict"), 8, split=False)
+        names = [str(i) for i in range(4)]
+        return (lambda: predict.predict_images(paths, model, names),
+                repeat, len(paths))
+    out["predict.predict_images"] = predict_images
+
+    def predict_tta():
+        import tensorflow as tf
+        import predict
+        import train
+        from keras import models, layers
+        train.models, train.layers, train.tf = models, layers, tf
+        model = train.create_model(4)
+        return (lambda: predict.predict_probs(model, batch, 8),
+                repeat, 8 * n)
+    out["predict.predict_probs_tta8"] = predict_tta
+
+    def get_data():
+        import tensorflow as tf
+        import train
+        train.tf = tf
+        root = os.path.join(work, "train")
+        make_tree(root, n // 4)
+
+        def epoch():
+            train_ds, _, _ = train.getData(root)
+            for _ in train_ds:
+                pass
+        count = sum(
+            len(files) for _, _, files in os.walk(os.path.join(root, "train"))
+        )
+        return epoch, 2, count
+    out["train.getData"] = get_data
+    return out
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get("stages", {}).get(name)
+        if not isinstance(r, dict) or not isinstance(base, dict):
+            continue
+        ratio = r["images_per_s"] / base["images_per_s"]
+        r["vs_baseline"] = ratio
+        if ratio < 1 - threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def report(results):
+    print(CYAN + f"\n{'STAGE':<28}{'img/s':>10}{'p50 ms':>9}{'p90 ms':>9}"
+          f"{'p99 ms':>9}{'alloc MB':>10}{'RSS MB':>9}{'vs base':>9}" + RESET)
+    for name, r in results.items():
+        if not isinstance(r, dict):
+            print(f"{name:<28}{YELLOW}skipped: {r}{RESET}")
+            continue
+        ratio = r.get("vs_baseline")
+        vs = f"{ratio:.2f}x" if ratio else "-"
+        print(f"{name:<28}{r['images_per_s']:>10.1f}{r['p50_ms']:>9.2f}"
+              f"{r['p90_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['peak_alloc_mb']:>10.1f}{r['peak_rss_mb']:>9.0f}{vs:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark every hot path on synthetic leaves"
+    )
+    parser.add_argument('-n', type=int, default=64, help='Synthetic images')
+    parser.add_argument('-size', type=int, default=256, help='Image side')
+    parser.add_argument('-repeat', type=int, default=5,
+                        help='Timed passes over the synthetic set')
+    parser.add_argument('-only', nargs='*', help='Stage name substrings')
+    parser.add_argument('-out', help='Write results JSON here')
+    parser.add_argument('-baseline', help='Baseline JSON to compare with')
+    parser.add_argument('-threshold', type=float, default=0.2,
+                        help='Allowed images/s drop vs baseline (0.2=20%%)')
+    args = parser.parse_args()
+
+    imgs = make_images(args.n, args.size)
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        for name, setup in stages(imgs, work, args.repeat).items():
+            if args.only and not any(s in name for s in args.only):
+                continue
+            if isinstance(setup, str):
+                results[name] = setup
+                continue
+            fn, calls, per_call = setup()
+            results[name] = measure(fn, calls, per_call)
+            print(f"\r{name:<40}", end="", flush=True)
+    print()
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    report(results)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({"n": args.n, "size": args.size,
+                       "stages": results}, f, indent=2)
+        print(f"\nResults saved to '{args.out}'.")
+
+    for name, ratio in regressions:
+        print(RED + f"REGRESSION: {name} at {ratio:.2f}x baseline" + RESET)
+    if regressions:
+        exit(1)
+    if args.baseline:
+        print(GREEN + "\nNo regressions." + RESET)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(RED + "Error: " + str(e) + RESET)
+        exit(1)
@@ -0,0 +1,79 @@
+import numpy as np
+import argparse
+import tempfile
+import time
+import cv2
+import sys
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from modules.config import CYAN, RED, RESET  # noqa: E402
+from modules.config import IMG_HEIGHT, IMG_WIDTH  # noqa: E402
+from modules.loader import imread, scale_for  # noqa: E402
+from modules.transforms import get_plant_mask  # noqa: E402
+from modules.segment import iou  # noqa: E402
+from synth import leaf  # noqa: E402
+
+TARGET = (IMG_WIDTH, IMG_HEIGHT)
+
+
+def prepare(path, target):
+    """predict.py's decode -> mask -> resize to the model input."""
+    rgb = cv2.cvtColor(imread(path, target), cv2.COLOR_BGR2RGB)
+    mask = get_plant_mask(rgb)
+    masked = cv2.bitwise_and(rgb, rgb, mask=mask)
+    return (cv2.resize(masked, TARGET),
+            cv2.resize(mask, TARGET, interpolation=cv2.INTER_NEAREST))
+
+
+def timed(paths, target, repeat):
+    out = [prepare(p, target) for p in paths]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for p in paths:
+            prepare(p, target)
+    ms = (time.perf_counter() - start) / (repeat * len(paths)) * 1000
+    return out, ms
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Full-size vs reduced-scale JPEG decoding"
+    )
+    parser.add_argument('-sizes', type=int, nargs='+',
+                        default=[256, 512, 1024, 2048],
+                        help='Synthetic JPEG sides')
+    parser.add_argument('-n', type=int, default=16, help='Images per size')
+    parser.add_argument('-repeat', type=int, default=3, help='Timed passes')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(CYAN + f"{'SIDE':>6}{'scale':>7}{'full ms':>9}{'fast ms':>9}"
+          f"{'speedup':>9}{'MAE':>7}{'mask IoU':>10}" + RESET)
+    with tempfile.TemporaryDirectory() as work:
+        for side in args.sizes:
+            paths = []
+            for i in range(args.n):
+                path = os.path.join(work, f"{side}_{i}.jpg")
+                cv2.imwrite(path, cv2.cvtColor(leaf(rng, side),
+                                               cv2.COLOR_RGB2BGR))
+                paths.append(path)
+            full, full_ms = timed(paths, None, args.repeat)
+            fast, fast_ms = timed(paths, TARGET, args.repeat)
+            mae = np.mean([np.abs(a.astype(np.int16) - b).mean()
+                           for (a, _), (b, _) in zip(full, fast)])
+            overlap = np.mean([iou(a, b) for (_, a), (_, b)
+                               in zip(full, fast)])
+            print(f"{side:>6}{'1/' + str(scale_for(side, side, TARGET)):>7}"
+                  f"{full_ms:>9.2f}{fast_ms:>9.2f}{full_ms / fast_ms:>8.1f}x"
+                  f"{mae:>7.2f}{overlap:>10.3f}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(RED + "Error: " + str(e) + RESET)
+        exit(1)
@@ -0,0 +1,90 @@
+import subprocess
+import argparse
+import tempfile
+import time
+import sys
+import os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+sys.path.insert(0, SRC)
+
+from modules.config import CYAN, GREEN, RED, RESET  # noqa: E402
+from modules.startup import parse_importtime  # noqa: E402
+from synth import make_tree  # noqa: E402
+
+HEAVY = ("tensorflow", "keras", "matplotlib", "cv2")
+SCRIPTS = ("Augmentation", "Distribution", "Transformation",
+           "Segmentation", "Pack", "predict", "train")
+
+
+def cases(work):
+    """
+    name -> (script, argv after its path, heavy modules the case needs)
+    of modes that never plot.
+    """
+    out = {f"{s} --help": (s, ["--help"], ()) for s in SCRIPTS}
+    src = os.path.join(work, "src")
+    make_tree(src, 4, size=64, split=False)
+    dst = os.path.join(work, "dst")
+    run(["Transformation", "-src", src, "-dst", dst])
+    out["Transformation no-op rerun"] = \
+        ("Transformation", ["-src", src, "-dst", dst], ())
+    out["Distribution --report"] = (
+        "Distribution", [src, "--report", os.path.join(work, "r.json")],
+        ("cv2",)
+    )
+    return out
+
+
+def run(argv, importtime=False):
+    script = os.path.join(SRC, argv[0] + ".py")
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) \
+        + [script] + argv[1:]
+    t = time.perf_counter()
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - t
+    assert proc.returncode == 0, f"{' '.join(argv)} failed"
+    return elapsed, proc.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Startup-time budget for every entry point"
+    )
+    parser.add_argument('-budget', type=float, default=1.0,
+                        help='Max seconds per command (best of -repeat)')
+    parser.add_argument('-repeat', type=int, default=3, help='Runs per case')
+    args = parser.parse_args()
+
+    failures = []
+    print(CYAN + f"{'CASE':<32}{'best s':>8}  heavy imports" + RESET)
+    with tempfile.TemporaryDirectory() as work:
+        for name, (script, argv, needs) in cases(work).items():
+            best = min(run([script] + argv)[0] for _ in range(args.repeat))
+            _, stderr = run([script] + argv, importtime=True)
+            heavy = sorted({
+                mod.split(".")[0] for mod, _, _, _ in parse_importtime(stderr)
+                if mod.split(".")[0] in HEAVY
+                and mod.split(".")[0] not in needs
+            })
+            print(f"{name:<32}{best:>8.2f}  {', '.join(heavy) or '-'}")
+            if best > args.budget:
+                failures.append(f"{name}: {best:.2f}s > {args.budget}s")
+            if heavy:
+                failures.append(f"{name}: imports {', '.join(heavy)}")
+
+    for failure in failures:
+        print(RED + "OVER BUDGET: " + failure + RESET)
+    if failures:
+        exit(1)
+    print(GREEN + "\nAll entry points within budget." + RESET)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(RED + "Error: " + str(e) + RESET)
+        exit(1)
@@ -0,0 +1,52 @@
+import numpy as np
+import cv2
+import os
+
+
+CLASSES = ["Apple_Healthy", "Apple_Scab", "Grape_Black_rot", "Grape_Spot"]
+
+
+def leaf(rng, size=256):
+    """One synthetic RGB leaf: green ellipse, brown spots, noisy soil."""
+    img = np.empty((size, size, 3), np.uint8)
+    img[:] = rng.integers(40, 90, 3)
+    c = size // 2
+    jitter = size // 8
+    center = tuple(int(v) for v in rng.integers(c - jitter, c + jitter, 2))
+    axes = (int(size * 0.35), int(size * 0.22))
+    angle = int(rng.integers(0, 180))
+    green = tuple(int(v) for v in (rng.integers(20, 60),
+                                   rng.integers(130, 200),
+                                   rng.integers(30, 80)))
+    cv2.ellipse(img, center, axes, angle, 0, 360, green, -1)
+    for _ in range(int(rng.integers(0, 12))):
+        spot = tuple(int(v) for v in rng.integers(c - 60, c + 60, 2))
+        cv2.circle(img, spot, int(rng.integers(3, 10)), (110, 70, 30), -1)
+    noise = rng.integers(0, 25, img.shape, dtype=np.uint8)
+    return cv2.add(img, noise)
+
+
+def make_images(n, size=256, seed=0):
+    rng = np.random.default_rng(seed)
+    return [leaf(rng, size) for _ in range(n)]
+
+
+def make_tree(root, per_class, size=256, seed=0, split=True):
+    """
+    Writes root/{train,val}/<class>/image (i).JPG (or root/<class>/...
+    when split is False) and returns the list of written paths.
+    """
+    rng = np.random.default_rng(seed)
+    paths = []
+    parts = [("train", per_class), ("val", max(1, per_class // 4))] \
+        if split else [("", per_class)]
+    for part, count in parts:
+        for name in CLASSES:
+            d = os.path.join(root, part, name)
+            os.makedirs(d, exist_ok=True)
+            for i in range(count):
+                path = os.path.join(d, f"image ({i + 1}).JPG")
+                cv2.imwrite(path, cv2.cvtColor(leaf(rng, size),
+                                               cv2.COLOR_RGB2BGR))
+                paths.append(path)
+    return paths
@@ -1,15 +1,20 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import argparse
-import cv2
+import time
+import sys
 import os
 
-from modules.config import DISPLAY, on_key, RED, RESET
-from modules.augments import transform
+from modules.config import DISPLAY, PREVIEW, on_key, RED, RESET
+from modules.augments import transform, AvailableTransforms
+from modules.writer import OutputWriter
+from modules.loader import imread
 from modules.dataset import build_pipeline
+from modules.split import build_split, save_split, counts, LINKS
+from modules.startup import profile_startup, FLAG
 
 
 def vis(data):
+    import matplotlib.pyplot as plt
     keys = list(data.keys())
     arr2d = list(data.values())
     if not arr2d or not arr2d[0]:
@@ -39,30 +44,49 @@ def vis(data):
     plt.show()
 
 
-def cved(path_list):
+def cved(path_list, target=None):
+    import cv2
     processed = []
     valid_paths = []
     for path in path_list:
         if not os.path.isfile(path):
             continue
-        img = cv2.imread(path)
+        img = imread(path, target)
         if img is not None:
             processed.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
             valid_paths.append(path)
     return processed, valid_paths
 
 
-def save_files(og_paths, data):
-    for change, imgs in data.items():
-        if change == "Original":
+def save_files(og_paths, writer):
+    """
+    One decode per source, every augmentation rendered in cv2's BGR
+    order (they are all geometric) and handed to the writer threads.
+    """
+    import cv2
+    count = 0
+    for path in og_paths:
+        img = cv2.imread(path)
+        if img is None:
             continue
-        suffix = "_" + change.replace(" ", "_")
-        for i, img_rgb in enumerate(imgs):
-            if i < len(og_paths):
-                root, ext = os.path.splitext(og_paths[i])
-                new_path = f"{root}{suffix}{ext}"
-                img_bgr = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-                cv2.imwrite(new_path, img_bgr)
+        root, ext = os.path.splitext(path)
+        for func, change in AvailableTransforms:
+            suffix = "_" + change.replace(" ", "_")
+            writer.submit(f"{root}{suffix}{ext}", func(img))
+        count += 1
+    writer.close()
+    return count
+
+
+def split_manifest(src, out, ratio, seed):
+    """Writes the hash-based split of src without touching any image."""
+    start = time.perf_counter()
+    split = build_split(src, ratio, seed)
+    save_split(split, out)
+    for name, (train, val) in counts(split).items():
+        print(f"[{name}]: {train} Train, {val} Val")
+    print(f"{len(split['paths'])} files split into '{out}' in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
 
 
 def main():
@@ -74,34 +98,64 @@ def main():
     parser.add_argument('-count', type=int, help='Target count of images')
     parser.add_argument('--pipeline', action='store_true', help='Build data')
     parser.add_argument('-ratio', type=float, default=0.8, help='Train ratio')
+    parser.add_argument('-workers', type=int, default=os.cpu_count(),
+                        help='Processes for --pipeline (default: all CPUs)')
+    parser.add_argument('-seed', type=int, default=42, help='Pipeline seed')
+    parser.add_argument('-writers', type=int, default=4,
+                        help='Encoder/writer threads for --save')
+    parser.add_argument('-quality', type=int,
+                        help='JPEG/WebP quality (0-100, default: cv2)')
+    parser.add_argument('-compression', type=int,
+                        help='PNG compression level (0-9, default: cv2)')
+    parser.add_argument('--force', action='store_true',
+                        help='Ignore the -dst manifest and rebuild')
+    parser.add_argument('-link', choices=LINKS, default='copy',
+                        help='How --pipeline places files in train/val')
+    parser.add_argument('-decode', type=int, metavar='SIDE',
+                        help='--pipeline: decode JPEGs down to ~SIDE px')
+    parser.add_argument('-split',
+                        help='Only write a split manifest of -src here')
+    parser.add_argument(FLAG, action='store_true',
+                        help='Print the slowest imports of this run')
     args = parser.parse_args()
 
     assert bool(args.imgs) != bool(args.src), "either pass imgs or src"
 
     if args.src:
         assert os.path.isdir(args.src), "src directory not valid"
+        if args.split:
+            split_manifest(args.src, args.split, args.ratio, args.seed)
+            return
         if args.pipeline:
             assert args.dst, "must provide -dst with --pipeline"
-            build_pipeline(args.src, args.dst, args.ratio, args.count)
+            build_pipeline(
+                args.src, args.dst, args.ratio, args.count,
+                workers=args.workers, seed=args.seed, force=args.force,
+                link=args.link, decode=args.decode
+            )
             return
 
         args.imgs = [os.path.join(args.src, f) for f in os.listdir(args.src)]
         args.imgs = [f for f in args.imgs if os.path.isfile(f)]
 
-    if not args.save:
-        args.imgs = args.imgs[:DISPLAY]
-
-    loaded_imgs, valid_paths = cved(args.imgs)
+    loaded_imgs, valid_paths = cved(args.imgs[:DISPLAY], (PREVIEW, PREVIEW))
     assert bool(loaded_imgs), "No valid images found"
 
     data = transform(loaded_imgs)
     vis(data)
     if args.save:
-        save_files(valid_paths, data)
-        print("Grid augmentations saved.")
+        writer = OutputWriter(
+            args.writers, quality=args.quality, compression=args.compression
+        )
+        count = save_files(
+            [p for p in args.imgs if os.path.isfile(p)], writer
+        )
+        print(f"Grid augmentations saved for {count} images.")
 
 
 if __name__ == "__main__":
+    if FLAG in sys.argv:
+        exit(profile_startup())
     try:
         main()
     except Exception as e:
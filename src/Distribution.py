@@ -1,14 +1,15 @@
-import matplotlib.pyplot as plt
 import argparse
+import sys
+import os
 
-from modules.config import parse, on_key, RED, RESET
+from modules.config import on_key, IMAGE_EXTS, RED, YELLOW, RESET
+from modules.index import build_index
+from modules.startup import profile_startup, FLAG
 
 
 def is_image(filename):
     """Safety check: ensures we only count actual images."""
-    return filename.lower().endswith(
-        ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
-    )
+    return filename.lower().endswith(IMAGE_EXTS)
 
 
 def pie_chart(all_files, counts, ax, dir):
@@ -38,6 +39,7 @@ def bar_chart(all_files, counts, ax, colors):
 
 
 def analyse(dir, all_files):
+    import matplotlib.pyplot as plt
     clean_files = {}
     for category, files in all_files.items():
         valid = [f for f in files if is_image(f)]
@@ -67,14 +69,45 @@ def main():
     parser = argparse.ArgumentParser(
         description="Analysis of Dataset: dir/subdirs/images.jpg"
     )
-    parser.add_argument('dir', help='directory of analysis')
+    parser.add_argument('dir', help='directory of analysis, or a pack')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Re-read every header, not just changed files')
+    parser.add_argument('--report',
+                        help='Headless report to out.json or out.html')
+    parser.add_argument(FLAG, action='store_true',
+                        help='Print the slowest imports of this run')
     args = parser.parse_args()
 
-    all_files = parse(args.dir)
+    reader = None
+    if os.path.isfile(os.path.join(args.dir, "index.json")):
+        from modules.shards import is_pack, pack_index, ShardReader
+        if is_pack(args.dir):
+            reader = ShardReader(args.dir)
+    index = pack_index(reader) if reader else \
+        build_index(args.dir, rescan=args.rescan)
+    if args.report:
+        from modules.report import build_report, write_report
+        report = build_report(args.dir, index, reader=reader)
+        assert report["total"], "No file found!"
+        write_report(report, args.report)
+        print(f"Report for {report['total']} images saved to "
+              f"'{args.report}'.")
+        return
+
+    all_files = {}
+    for category, files in sorted(index.items()):
+        valid = [f for f, rec in files.items() if rec.get("valid")]
+        bad = len(files) - len(valid)
+        if bad:
+            print(YELLOW + f"  ! {category}: {bad} corrupt/empty skipped"
+                  + RESET)
+        all_files[category] = valid
     analyse(args.dir, all_files)
 
 
 if __name__ == "__main__":
+    if FLAG in sys.argv:
+        exit(profile_startup())
     try:
         main()
     except Exception as e:
@@ -0,0 +1,85 @@
+import argparse
+import time
+import sys
+import os
+
+from modules.config import CYAN, GREEN, RED, RESET
+from modules.cache import scan
+from modules.split import is_split, load_split
+from modules.shards import pack, KINDS
+from modules.startup import profile_startup, FLAG
+
+
+def collect(src):
+    """
+    (entries, classes) of a split manifest, a train/ + val/ directory
+    or a plain dir/<class>/ tree; entries are (path, label, split flag).
+    """
+    if is_split(src):
+        split = load_split(src)
+        return [
+            (os.path.join(split["root"], p), label, s)
+            for p, label, s in
+            zip(split["paths"], split["labels"], split["splits"])
+        ], split["classes"]
+
+    parts = [p for p in ("train", "val")
+             if os.path.isdir(os.path.join(src, p))]
+    if not parts:
+        classes, entries = scan(src)
+        return [(os.path.join(src, rel), label, "-")
+                for rel, label in entries], classes
+
+    entries, classes = [], None
+    for part in parts:
+        names, listed = scan(os.path.join(src, part))
+        assert classes in (None, names), "Mismatched classes"
+        classes = names
+        entries += [(os.path.join(src, part, rel), label, part[0])
+                    for rel, label in listed]
+    return entries, classes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack a dataset into a few large indexed shards"
+    )
+    parser.add_argument('src',
+                        help='dir/<class>, train/ + val/ dir or split .json')
+    parser.add_argument('-dst', required=True, help='Output pack directory')
+    parser.add_argument('-kind', choices=KINDS, default='jpeg',
+                        help='Original bytes or preprocessed uint8 arrays')
+    parser.add_argument('-shard-mb', type=int, default=256,
+                        help='Target shard size (MB)')
+    parser.add_argument('-mask', action='store_true',
+                        help='Mask leaves before storing (-kind array only)')
+    parser.add_argument('-workers', type=int, default=8,
+                        help='Reader/preprocess threads')
+    parser.add_argument(FLAG, action='store_true',
+                        help='Print the slowest imports of this run')
+    args = parser.parse_args()
+
+    assert os.path.exists(args.src), f"Cannot find '{args.src}'"
+    assert args.shard_mb > 0, "-shard-mb must be positive"
+    start = time.perf_counter()
+    print(CYAN + "\nPACKING:" + RESET)
+    entries, classes = collect(args.src)
+    assert entries, "No image found!"
+    count = pack(entries, classes, args.dst, args.kind, args.shard_mb,
+                 args.mask, args.workers)
+    elapsed = time.perf_counter() - start
+    print(GREEN + f"{count} images from {len(classes)} classes packed "
+          f"into '{args.dst}' in {elapsed:.2f}s "
+          f"({count / elapsed:.1f} images/s)" + RESET)
+    if count < len(entries):
+        print(f"{len(entries) - count} unreadable files skipped.")
+
+
+if __name__ == "__main__":
+    if FLAG in sys.argv:
+        exit(profile_startup())
+    try:
+        main()
+    except Exception as e:
+        print(RED + "Error: " + str(e) + RESET)
+        exit(1)
@@ -0,0 +1,85 @@
+import numpy as np
+import argparse
+import time
+import sys
+import os
+
+from modules.config import CYAN, GREEN, RED, RESET
+from modules.segment import Backends, iou
+from modules.startup import profile_startup, FLAG
+
+
+def load(paths):
+    import cv2
+    imgs = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is not None:
+            imgs.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    return imgs
+
+
+def benchmark(imgs, backends, repeat):
+    """ms/image per backend and mask IoU against 'reference'."""
+    refs = [Backends["reference"](img) for img in imgs]
+    results = {}
+    for name in backends:
+        func = Backends[name]
+        func(imgs[0])
+        start = time.perf_counter()
+        for _ in range(repeat):
+            masks = [func(img) for img in imgs]
+        elapsed = time.perf_counter() - start
+        scores = [iou(m, r) for m, r in zip(masks, refs)]
+        results[name] = {
+            "ms": elapsed * 1000 / (repeat * len(imgs)),
+            "iou_mean": float(np.mean(scores)),
+            "iou_min": float(np.min(scores))
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark leaf mask backends (ms/image and IoU)"
+    )
+    parser.add_argument('imgs', nargs='*', help='Image files')
+    parser.add_argument('-src', help='Source directory (Recursive)')
+    parser.add_argument('-backends', nargs='+', default=list(Backends),
+                        choices=list(Backends), help='Backends to compare')
+    parser.add_argument('-n', type=int, default=64, help='Max images')
+    parser.add_argument('-repeat', type=int, default=3, help='Timed passes')
+    parser.add_argument(FLAG, action='store_true',
+                        help='Print the slowest imports of this run')
+    args = parser.parse_args()
+
+    assert bool(args.imgs) != bool(args.src), "either pass imgs or src"
+    paths = args.imgs
+    if args.src:
+        assert os.path.isdir(args.src), "src directory not valid"
+        paths = [
+            os.path.join(root, f)
+            for root, _, files in os.walk(args.src) for f in sorted(files)
+        ]
+    imgs = load(paths[:args.n])
+    assert bool(imgs), "No valid images found"
+
+    print(CYAN + f"\nMASK BACKENDS ({len(imgs)} images):" + RESET)
+    results = benchmark(imgs, args.backends, args.repeat)
+    base = results.get("reference", {}).get("ms")
+    for name, r in results.items():
+        speed = f"x{base / r['ms']:.2f}" if base else ""
+        color = GREEN if r["iou_min"] >= 0.95 else RED
+        print(f"  {name:<10} {r['ms']:8.2f} ms/image {speed:>7}  "
+              f"{color}IoU mean {r['iou_mean']:.4f} "
+              f"min {r['iou_min']:.4f}{RESET}")
+
+
+if __name__ == "__main__":
+    if FLAG in sys.argv:
+        exit(profile_startup())
+    try:
+        main()
+    except Exception as e:
+        print(RED + "Error: " + str(e) + RESET)
+        exit(1)
@@ -1,21 +1,26 @@
-import matplotlib.pyplot as plt
 import argparse
 import numpy as np
-import cv2
+import sys
 import os
 
-from modules.config import DISPLAY, on_key, RED, RESET
-from modules.transforms import transform
+from modules.config import DISPLAY, PREVIEW, MASK_BACKEND, on_key
+from modules.config import IMAGE_EXTS, RED, RESET
+from modules.transforms import transform, transform_one, select_ops
+from modules.transforms import TRANSFORM_VERSION
+from modules.manifest import Manifest
+from modules.writer import OutputWriter
+from modules.loader import imread
+from modules.report import image_histograms, CHANNELS
+from modules.startup import profile_startup, FLAG
 
 
 def is_image(filename):
     """Safety check: ensures we only process actual images."""
-    return filename.lower().endswith(
-        ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
-    )
+    return filename.lower().endswith(IMAGE_EXTS)
 
 
 def vis(data):
+    import matplotlib.pyplot as plt
     keys = list(data.keys())
     arr2d = list(data.values())
     if not arr2d or not arr2d[0]:
@@ -50,19 +55,8 @@ def vis_histogram_analysis(img_rgb):
     Replicates the complex histogram from Leaffliction Figure IV.7.
     Plots RGB, HSV, and LAB channels all on one graph.
     """
-    img_hsv = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2HSV)
-    img_lab = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2LAB)
-    channels = [
-        (img_rgb, 0, 'Red', 'red'),
-        (img_rgb, 1, 'Green', 'green'),
-        (img_rgb, 2, 'Blue', 'blue'),
-        (img_hsv, 0, 'Hue', 'purple'),
-        (img_hsv, 1, 'Saturation', 'cyan'),
-        (img_hsv, 2, 'Value', 'orange'),
-        (img_lab, 0, 'Lightness', 'black'),
-        (img_lab, 1, 'Green-Magenta', 'magenta'),
-        (img_lab, 2, 'Blue-Yellow', 'yellow')
-    ]
+    import matplotlib.pyplot as plt
+    hist = image_histograms(img_rgb)
     fig, (ax_img, ax_hist) = plt.subplots(
         nrows=1, ncols=2,
         figsize=(14, 6),
@@ -72,10 +66,9 @@ def vis_histogram_analysis(img_rgb):
     ax_img.set_title("Original Image")
     ax_img.axis('off')
 
-    for (src_img, channel_idx, label, color) in channels:
-        hist = cv2.calcHist([src_img], [channel_idx], None, [256], [0, 256])
-        total_pixels = src_img.shape[0] * src_img.shape[1]
-        hist_proportion = (hist / total_pixels) * 100
+    total_pixels = img_rgb.shape[0] * img_rgb.shape[1]
+    for i, (label, color) in enumerate(CHANNELS):
+        hist_proportion = (hist[i] / total_pixels) * 100
         ax_hist.plot(
             hist_proportion, color=color,
             label=label, linewidth=1.2, alpha=0.7
@@ -92,43 +85,89 @@ def vis_histogram_analysis(img_rgb):
     plt.show()
 
 
-def cved(path_list):
+def cved(path_list, target=None):
+    import cv2
     processed = []
     valid_paths = []
     for path in path_list:
         if not os.path.isfile(path):
             continue
-        img = cv2.imread(path)
+        img = imread(path, target)
         if img is not None:
             processed.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
             valid_paths.append(path)
     return processed, valid_paths
 
 
-def save_files(og_paths, data, dst, src_root):
+def out_path(original_full_path, change, dst, src_root):
+    if src_root:
+        rel_path = os.path.relpath(original_full_path, src_root)
+    else:
+        rel_path = os.path.basename(original_full_path)
+    dest_dir = os.path.join(dst, os.path.dirname(rel_path))
+    filename = os.path.basename(rel_path)
+    name, ext = os.path.splitext(filename)
+    os.makedirs(dest_dir, exist_ok=True)
+    suffix = "_" + change.replace(" ", "_")
+    return os.path.join(dest_dir, f"{name}{suffix}{ext}")
+
+
+def stream_files(path_list, selection, dst, src_root, writer, force=False):
     """
-    Saves files while preserving the subdirectory structure from src_root.
+    read -> transform -> encode/write, one image at a time.
+    Images stay in cv2's BGR decode order end to end, every selected
+    transform is rendered from one LeafAnalysis, and the writer's
+    bounded window keeps memory flat however large the source tree is.
+    Sources whose outputs are all recorded in the dst manifest with an
+    unchanged content hash are skipped without decoding. The manifest
+    is keyed by the source root, so a second -src into the same -dst
+    starts a fresh manifest instead of pruning the first one's outputs.
     """
-    for change, imgs in data.items():
-        if change == "Original":
+    ops = select_ops(selection)
+    manifest = Manifest(dst, {
+        "tool": "Transformation", "version": TRANSFORM_VERSION,
+        "src": os.path.abspath(src_root) if src_root else None,
+        "mask_backend": MASK_BACKEND, "quality": writer.quality,
+        "compression": writer.compression
+    })
+    if force:
+        manifest.outputs = {}
+    planned = []
+    count = skipped = 0
+    for path in path_list:
+        if not os.path.isfile(path):
             continue
+        targets = {k: out_path(path, k, dst, src_root) for k in ops}
+        if all(manifest.fresh(path, t, k) for k, t in targets.items()):
+            skipped += 1
+        else:
+            img = imread(path)
+            if img is None:
+                continue
+            for k, out in transform_one(img, ops, bgr=True).items():
+                writer.submit(targets[k], out)
+            count += 1
+        for k, t in targets.items():
+            manifest.record(path, t, k)
+            planned.append(t)
+    writer.close()
+
+    removed = 0
+    if src_root:
+        removed = manifest.prune(
+            planned,
+            lambda e: e["transform"] in ops or not os.path.exists(e["src"])
+        )
+    manifest.save()
+    print(f"{skipped} unchanged, {removed} stale outputs removed.")
+    return count
 
-        suffix = "_" + change.replace(" ", "_")
-        for i, img_rgb in enumerate(imgs):
-            if i >= len(og_paths):
-                break
-            original_full_path = og_paths[i]
-            if src_root:
-                rel_path = os.path.relpath(original_full_path, src_root)
-            else:
-                rel_path = os.path.basename(original_full_path)
-            dest_dir = os.path.join(dst, os.path.dirname(rel_path))
-            filename = os.path.basename(rel_path)
-            name, ext = os.path.splitext(filename)
-            os.makedirs(dest_dir, exist_ok=True)
-            new_path = os.path.join(dest_dir, f"{name}{suffix}{ext}")
-            img_bgr = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-            cv2.imwrite(new_path, img_bgr)
+
+def walk_images(src):
+    for root, _, files in os.walk(src):
+        for file in sorted(files):
+            if is_image(file):
+                yield os.path.join(root, file)
 
 
 def main():
@@ -137,29 +176,47 @@ def main():
     parser.add_argument('-src', help='Source directory (Recursive)')
     parser.add_argument('-dst', help='Destination directory')
     parser.add_argument('-tsf', help='"mask", "blur", "roi"')
+    parser.add_argument('-window', type=int, default=16,
+                        help='Max images in flight when streaming to -dst')
+    parser.add_argument('-writers', type=int, default=4,
+                        help='Encoder/writer threads')
+    parser.add_argument('-quality', type=int,
+                        help='JPEG/WebP quality (0-100, default: cv2)')
+    parser.add_argument('-compression', type=int,
+                        help='PNG compression level (0-9, default: cv2)')
+    parser.add_argument('--force', action='store_true',
+                        help='Ignore the -dst manifest and redo everything')
+    parser.add_argument(FLAG, action='store_true',
+                        help='Print the slowest imports of this run')
     args = parser.parse_args()
 
     assert bool(args.imgs) != bool(args.src), "either pass imgs or src"
+    assert args.window > 0, "-window must be positive"
+    paths = args.imgs
     if args.src:
         assert os.path.isdir(args.src), "src directory not valid"
-        for root, _, files in os.walk(args.src):
-            for file in files:
-                if is_image(file):
-                    args.imgs.append(os.path.join(root, file))
-
-    if not args.dst:
-        args.imgs = args.imgs[:DISPLAY]
-    imgs, valid_paths = cved(args.imgs)
+        paths = walk_images(args.src)
+
+    if args.dst:
+        writer = OutputWriter(
+            args.writers, args.window, args.quality, args.compression
+        )
+        count = stream_files(
+            paths, args.tsf, args.dst, args.src, writer, args.force
+        )
+        print(f"Transformed {count} images into '{args.dst}'.")
+        return
+
+    imgs, valid_paths = cved(list(paths)[:DISPLAY], (PREVIEW, PREVIEW))
     data = transform(imgs, selection=args.tsf)
     vis(data)
-    if imgs and not args.dst:
+    if imgs:
         vis_histogram_analysis(imgs[0])
 
-    if args.dst:
-        save_files(valid_paths, data, args.dst, args.src)
-
 
 if __name__ == "__main__":
+    if FLAG in sys.argv:
+        exit(profile_startup())
     try:
         main()
     except Exception as e:
@@ -1,15 +1,97 @@
 import numpy as np
-import cv2
+from functools import lru_cache
 
 
-def apply_skew(img):
-    """Skew: Perspective tilt."""
-    rows, cols = img.shape[:2]
+MAP_CACHE_SIZE = 16
+# side of the source images the distortion was tuned on (20 px, 150 px)
+DISTORT_SIDE = 256
+
+
+def skew_matrix(rows, cols):
+    import cv2
     pts1 = np.float32([[0, 0], [cols, 0], [0, rows], [cols, rows]])
     squeeze = int(cols * 0.2)
     pts2 = np.float32([[0, 0], [cols-squeeze, 0], [0, rows], [cols, rows]])
-    M = cv2.getPerspectiveTransform(pts1, pts2)
-    return cv2.warpPerspective(img, M, (cols, rows))
+    return cv2.getPerspectiveTransform(pts1, pts2)
+
+
+def shear_matrix(rows, cols):
+    shear = 0.2
+    return np.float32([[1, shear, 0], [0, 1, 0], [0, 0, 1]])
+
+
+def distortion_field(x, y, rows, cols):
+    """
+    Sine warp scaled to the image, so a 128 px model input is distorted
+    as much, relative to the leaf, as a 256 px source image.
+    """
+    sx, sy = cols / DISTORT_SIDE, rows / DISTORT_SIDE
+    x_dist = x + (20 * sx * np.sin(2 * np.pi * y / (150 * sy)))
+    y_dist = y + (20 * sy * np.sin(2 * np.pi * x / (150 * sx)))
+    return x_dist, y_dist
+
+
+@lru_cache(maxsize=MAP_CACHE_SIZE)
+def warp_maps(kind, rows, cols):
+    """
+    Fixed-point remap grids for one (warp, image shape), built once.
+    Skew and shear are inverted into per-pixel source coordinates so
+    every geometric augment runs through the same cv2.remap kernel.
+    """
+    import cv2
+    x, y = np.meshgrid(
+        np.arange(cols, dtype=np.float64),
+        np.arange(rows, dtype=np.float64)
+    )
+    if kind == "Distortion":
+        map_x, map_y = distortion_field(x, y, rows, cols)
+    else:
+        M = skew_matrix(rows, cols) if kind == "Skew" else \
+            shear_matrix(rows, cols)
+        inv = np.linalg.inv(M)
+        w = inv[2, 0] * x + inv[2, 1] * y + inv[2, 2]
+        map_x = (inv[0, 0] * x + inv[0, 1] * y + inv[0, 2]) / w
+        map_y = (inv[1, 0] * x + inv[1, 1] * y + inv[1, 2]) / w
+    return cv2.convertMaps(
+        map_x.astype(np.float32),
+        map_y.astype(np.float32),
+        cv2.CV_16SC2
+    )
+
+
+def batched(kernel, imgs):
+    """
+    Runs a per-image OpenCV kernel on an image or a (N, H, W, C) batch.
+    Folding the batch into channels was measured slower than this loop
+    (the transposes cost more than the calls), so batches reuse one
+    cached map per shape and write straight into a stacked output.
+    """
+    if imgs.ndim == 3:
+        return kernel(imgs)
+    out = None
+    for i, img in enumerate(imgs):
+        res = kernel(img)
+        if out is None:
+            out = np.empty((len(imgs),) + res.shape, res.dtype)
+        out[i] = res
+    return out
+
+
+def remap(imgs, kind, border=None):
+    import cv2
+    border = cv2.BORDER_CONSTANT if border is None else border
+    rows, cols = imgs.shape[-3:-1]
+    map1, map2 = warp_maps(kind, rows, cols)
+    return batched(
+        lambda x: cv2.remap(x, map1, map2, cv2.INTER_LINEAR,
+                            borderMode=border),
+        imgs
+    )
+
+
+def apply_skew(img):
+    """Skew: Perspective tilt."""
+    return remap(img, "Skew")
 
 
 def apply_shear(img):
@@ -17,24 +99,13 @@ def apply_shear(img):
     Shear: Slants the image horizontally.
     Fixes: Keeps original size and fills gaps with reflection.
     """
-    rows, cols = img.shape[:2]
-    shear = 0.2
-    M = np.float32([[1, shear, 0], [0, 1, 0]])
-    return cv2.warpAffine(img, M, (cols, rows), borderMode=cv2.BORDER_REFLECT)
+    import cv2
+    return remap(img, "Shear", cv2.BORDER_REFLECT)
 
 
 def apply_distortion(img):
     """Distortion: Wavy effect."""
-    rows, cols = img.shape[:2]
-    x, y = np.meshgrid(np.arange(cols), np.arange(rows))
-    x_dist = x + (20 * np.sin(2 * np.pi * y / 150))
-    y_dist = y + (20 * np.sin(2 * np.pi * x / 150))
-    return cv2.remap(
-        img,
-        x_dist.astype(np.float32),
-        y_dist.astype(np.float32),
-        cv2.INTER_LINEAR
-    )
+    return remap(img, "Distortion")
 
 
 def apply_crop(img):
@@ -42,34 +113,70 @@ def apply_crop(img):
     Center Crop (80%) and Resize back to original.
     Prevents image dimension mismatch errors later.
     """
-    h, w = img.shape[:2]
+    import cv2
+    h, w = img.shape[-3:-1]
     scale = 0.8
     new_h, new_w = int(h * scale), int(w * scale)
     top = (h - new_h) // 2
     left = (w - new_w) // 2
-    cropped = img[top:top+new_h, left:left+new_w]
-    return cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LINEAR)
+    cropped = img[..., top:top+new_h, left:left+new_w, :]
+    return batched(
+        lambda x: cv2.resize(x, (w, h), interpolation=cv2.INTER_LINEAR),
+        cropped
+    )
 
 
 def apply_flip(img):
-    return cv2.flip(img, 0)
+    import cv2
+    return batched(lambda x: cv2.flip(x, 0), img)
 
 
 def apply_rotate(img):
-    return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    import cv2
+    return batched(lambda x: cv2.rotate(x, cv2.ROTATE_90_CLOCKWISE), img)
+
+
+# Deterministic test-time views, composed right to left
+TestViews = [
+    (),
+    (apply_flip,),
+    (apply_rotate,),
+    (apply_crop,),
+    (apply_rotate, apply_rotate),
+    (apply_flip, apply_rotate),
+    (apply_crop, apply_flip),
+    (apply_crop, apply_rotate)
+]
+
+
+def test_views(batch, k):
+    """
+    (k * N, H, W, C) stack of the first k TestViews of a square
+    (N, H, W, C) batch, view-major: every transform runs once over the
+    whole batch, never once per image and view.
+    """
+    assert 1 <= k <= len(TestViews), \
+        f"TTA views must be 1-{len(TestViews)}"
+    n = len(batch)
+    out = np.empty((k * n,) + batch.shape[1:], batch.dtype)
+    for v, funcs in enumerate(TestViews[:k]):
+        view = batch
+        for func in reversed(funcs):
+            view = func(view)
+        out[v * n:(v + 1) * n] = view
+    return out
 
 
 def transform(imgs):
     """Original Dictionary logic for Grid Visualization"""
-    data = {
-        "Original":   imgs,
-        "Flip":       [apply_flip(img) for img in imgs],
-        "Rotate":     [apply_rotate(img) for img in imgs],
-        "Skew":       [apply_skew(img) for img in imgs],
-        "Shear":      [apply_shear(img) for img in imgs],
-        "Crop":       [apply_crop(img) for img in imgs],
-        "Distortion": [apply_distortion(img) for img in imgs]
-    }
+    data = {"Original": imgs}
+    if imgs and all(img.shape == imgs[0].shape for img in imgs):
+        batch = np.stack(imgs)
+        for func, name in AvailableTransforms:
+            data[name] = list(func(batch))
+    else:
+        for func, name in AvailableTransforms:
+            data[name] = [func(img) for img in imgs]
     return data
 
 
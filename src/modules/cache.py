@@ -0,0 +1,166 @@
+import numpy as np
+import hashlib
+import json
+import os
+
+from .config import IMG_HEIGHT, IMG_WIDTH, IMAGE_EXTS
+from .manifest import file_digest
+from .preprocess import prepare_path
+
+
+CACHE_VERSION = 2
+PREPROCESS = {
+    "version": CACHE_VERSION,
+    "height": IMG_HEIGHT,
+    "width": IMG_WIDTH,
+    "color": "rgb",
+    "interpolation": "bilinear",
+    "decode": "full",
+    "dtype": "uint8"
+}
+
+
+def settings_key(settings=PREPROCESS):
+    blob = json.dumps(settings, sort_keys=True).encode()
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def scan(split_dir):
+    """Class-labelled files, ordered like image_dataset_from_directory."""
+    class_names = sorted(
+        d for d in os.listdir(split_dir)
+        if os.path.isdir(os.path.join(split_dir, d))
+    )
+    entries = []
+    for label, name in enumerate(class_names):
+        class_dir = os.path.join(split_dir, name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for f in sorted(files):
+                if f.lower().endswith(IMAGE_EXTS):
+                    path = os.path.join(root, f)
+                    entries.append((os.path.relpath(path, split_dir), label))
+    return class_names, entries
+
+
+def source_key(split_dir, listing=None):
+    """
+    Identity of a cache's source: the absolute root, plus a digest of
+    the explicit listing of a split manifest. A scanned directory keeps
+    its key as files change, so edits stay incremental; two manifests
+    over one root, or two datasets, never share a cache.
+    """
+    h = hashlib.sha1(os.path.abspath(split_dir).encode())
+    if listing:
+        class_names, entries = listing
+        h.update(json.dumps([class_names, entries]).encode())
+    return h.hexdigest()[:12]
+
+
+def load_index(cache_dir):
+    path = os.path.join(cache_dir, "index.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def build_cache(split_dir, cache_root, listing=None, name=None, mask=False):
+    """
+    Persistent (N, H, W, 3) uint8 memmap of a split, keyed by the
+    preprocessing settings and a content hash of the source tree.
+    Files are re-hashed only when their mtime/size moved, and only new
+    or changed images are decoded; the rest are copied from the old
+    cache. 'listing' ((class_names, entries) relative to split_dir, as
+    from a split manifest) replaces the directory scan, and 'name' the
+    split directory's name; the cache directory is also keyed by
+    source_key. Images go through preprocess.prepare_path, masked on
+    the fly with 'mask'. Returns (images, labels, class_names).
+    """
+    split = name or os.path.basename(os.path.normpath(split_dir))
+    settings = dict(PREPROCESS, mask=bool(mask))
+    cache_dir = os.path.join(
+        cache_root,
+        f"{split}-{source_key(split_dir, listing)}-{settings_key(settings)}"
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    images_path = os.path.join(cache_dir, "images.npy")
+
+    old = load_index(cache_dir)
+    old_files = old.get("files", {})
+    class_names, entries = listing or scan(split_dir)
+
+    files = {}
+    for rel, label in entries:
+        path = os.path.join(split_dir, rel)
+        st = os.stat(path)
+        prev = old_files.get(rel)
+        if prev and prev["mtime"] == st.st_mtime and \
+                prev["size"] == st.st_size:
+            digest = prev["sha1"]
+        else:
+            digest = file_digest(path)
+        files[rel] = {
+            "mtime": st.st_mtime, "size": st.st_size,
+            "sha1": digest, "label": label
+        }
+
+    tree = hashlib.sha1()
+    for rel in sorted(files):
+        tree.update(f"{rel}\0{files[rel]['sha1']}\0".encode())
+    tree_hash = tree.hexdigest()
+
+    if old.get("tree") == tree_hash and os.path.exists(images_path):
+        images = np.load(images_path, mmap_mode='r')
+        labels = np.load(os.path.join(cache_dir, "labels.npy"))
+        print(f"[cache] '{split}': {len(labels)} images, up to date.")
+        return images, labels, old["classes"]
+
+    by_sha = {v["sha1"]: v["row"] for v in old_files.values() if "row" in v}
+    prev_images = None
+    if by_sha and os.path.exists(images_path):
+        prev_images = np.load(images_path, mmap_mode='r')
+
+    rows = []
+    tmp_path = os.path.join(cache_dir, "images.tmp.npy")
+    out = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.uint8,
+        shape=(len(files), IMG_HEIGHT, IMG_WIDTH, 3)
+    )
+    decoded = 0
+    for rel, _ in entries:
+        meta = files[rel]
+        row = by_sha.get(meta["sha1"])
+        if prev_images is not None and row is not None:
+            out[len(rows)] = prev_images[row]
+        else:
+            img = prepare_path(os.path.join(split_dir, rel), mask)
+            if img is None:
+                del files[rel]
+                continue
+            out[len(rows)] = img
+            decoded += 1
+        meta["row"] = len(rows)
+        rows.append(meta["label"])
+    out.flush()
+    del out, prev_images
+
+    n = len(rows)
+    if n < len(entries):
+        trimmed = np.load(tmp_path, mmap_mode='r')[:n]
+        np.save(images_path + ".part.npy", trimmed)
+        del trimmed
+        os.replace(images_path + ".part.npy", images_path)
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, images_path)
+    labels = np.array(rows, dtype=np.int32)
+    np.save(os.path.join(cache_dir, "labels.npy"), labels)
+    with open(os.path.join(cache_dir, "index.json"), 'w') as f:
+        json.dump({
+            "tree": tree_hash, "settings": settings,
+            "classes": class_names, "files": files
+        }, f)
+
+    print(f"[cache] '{split}': {n} images, {decoded} decoded, "
+          f"{n - decoded} reused.")
+    return np.load(images_path, mmap_mode='r'), labels, class_names
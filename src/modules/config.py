@@ -1,6 +1,4 @@
-import matplotlib.pyplot as plt
 import os
-import random
 import shutil
 
 
@@ -11,23 +9,29 @@ CYAN = "\033[96m"
 RESET = "\033[0m"
 
 DISPLAY = 6
+# JPEGs shown in on-screen grids are decoded down to about this size
+PREVIEW = 256
 
 IMG_HEIGHT = 128
 IMG_WIDTH = 128
 BATCH_SIZE = 32
 EPOCHS = 20
+# every listing (train, cache, split, index, predict) reads these files
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
 
+# reference | lut | separable | downscale | fast (see Segmentation.py)
+MASK_BACKEND = "reference"
 
-def split_dataset(src_dir, ratio):
-    files = [
+
+def split_dataset(src_dir, ratio, seed=42):
+    from .split import splitter
+    files = sorted(
         f for f in os.listdir(src_dir)
         if os.path.isfile(os.path.join(src_dir, f))
-    ]
-    random.shuffle(files)
-
-    split_idx = int(len(files) * ratio)
-    train_files = files[:split_idx]
-    val_files = files[split_idx:]
+    )
+    assign = splitter(seed, ratio)
+    train_files = [f for f in files if assign(f) == "train"]
+    val_files = [f for f in files if assign(f) == "val"]
 
     train_dir = os.path.join(src_dir, 'train')
     val_dir = os.path.join(src_dir, 'val')
@@ -44,6 +48,7 @@ def split_dataset(src_dir, ratio):
 
 
 def on_key(event):
+    import matplotlib.pyplot as plt
     if event.key == 'escape':
         plt.close(event.canvas.figure)
 
@@ -1,62 +1,174 @@
 import os
+import time
 import random
-import shutil
-import cv2
+from concurrent.futures import ProcessPoolExecutor
 from .augments import AvailableTransforms
+from .manifest import Manifest
+from .split import splitter, place
+from .loader import imread
+from .config import IMAGE_EXTS
 
 
-def balance_directory(train_paths, train_dir, target_count):
-    needed = target_count - len(train_paths)
-    if needed <= 0:
-        return
+def class_rng(seed, rel_path, *salt):
+    """Stable RNG per class (and task), independent of worker scheduling."""
+    return random.Random(":".join(str(s) for s in (seed, rel_path) + salt))
 
-    for i in range(needed):
-        rand_path = random.choice(train_paths)
-        img = cv2.imread(rand_path)
-        if img is None:
-            continue
 
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        func, name = random.choice(AvailableTransforms)
-        aug_img = func(img_rgb)
-        aug_img_bgr = cv2.cvtColor(aug_img, cv2.COLOR_RGB2BGR)
+def plan_augments(train_paths, train_dir, target_count, rng):
+    """
+    Decides every synthetic image up front: (source, transform, save path).
+    Planning is serial and seeded, so the output does not depend on workers.
+    """
+    tasks = []
+    needed = target_count - len(train_paths)
+    for i in range(max(needed, 0)):
+        rand_path = rng.choice(train_paths)
+        t_idx = rng.randrange(len(AvailableTransforms))
+        name = AvailableTransforms[t_idx][1]
 
         base_name = os.path.splitext(os.path.basename(rand_path))[0]
         ext = os.path.splitext(rand_path)[1]
         save_path = os.path.join(train_dir, f"{base_name}_aug_{i}_{name}{ext}")
+        tasks.append((rand_path, t_idx, save_path))
+    return tasks
+
+
+def augment_one(task):
+    """
+    Worker: decode, augment and re-encode one synthetic image. With a
+    decode target (w, h), JPEG sources are decoded at reduced scale.
+    """
+    import cv2
+    rand_path, t_idx, save_path, target = task
+    img = imread(rand_path, target)
+    if img is None:
+        return 0
+
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    func, _ = AvailableTransforms[t_idx]
+    aug_img = func(img_rgb)
+    aug_img_bgr = cv2.cvtColor(aug_img, cv2.COLOR_RGB2BGR)
+    return int(cv2.imwrite(save_path, aug_img_bgr))
+
+
+def balance_directory(train_paths, train_dir, target_count, seed=None,
+                      target=None):
+    tasks = plan_augments(
+        train_paths, train_dir, target_count,
+        class_rng(seed, train_dir, "augment")
+    )
+    return sum(augment_one(t + (target,)) for t in tasks)
 
-        cv2.imwrite(save_path, aug_img_bgr)
 
+def plan_split(job):
+    """Hash-based train/val split of one class: returns copy tasks."""
+    root, rel_path, imgs, dst_root, ratio, seed = job
+    train_dir = os.path.join(dst_root, 'train', rel_path)
+    val_dir = os.path.join(dst_root, 'val', rel_path)
 
-def build_pipeline(src_root, dst_root, ratio, target_count):
+    os.makedirs(train_dir, exist_ok=True)
+    os.makedirs(val_dir, exist_ok=True)
+
+    assign = splitter(seed, ratio)
+    train, val = [], []
+    for f in sorted(imgs):
+        if assign(os.path.join(rel_path, f)) == "train":
+            train.append((os.path.join(root, f), os.path.join(train_dir, f)))
+        else:
+            val.append((os.path.join(root, f), os.path.join(val_dir, f)))
+    return train_dir, train, val
+
+
+def copy_one(task):
+    """Worker: copies (or links) one file into its train/val split."""
+    src, dst, link = task
+    place(src, dst, link)
+    return 1
+
+
+def find_classes(src_root, dst_root, ratio, seed):
+    jobs = []
     for root, dirs, fs in os.walk(src_root):
-        imgs = [f for f in fs if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+        imgs = [f for f in fs if f.lower().endswith(IMAGE_EXTS)]
         if not imgs:
             continue
-
         rel_path = os.path.relpath(root, src_root)
-        train_dir = os.path.join(dst_root, 'train', rel_path)
-        val_dir = os.path.join(dst_root, 'val', rel_path)
+        jobs.append((root, rel_path, imgs, dst_root, ratio, seed))
+    return sorted(jobs, key=lambda j: j[1])
+
+
+def fan_out(pool, func, tasks, workers):
+    if not pool:
+        return sum(map(func, tasks))
+    chunk = max(1, len(tasks) // (workers * 4))
+    return sum(pool.map(func, tasks, chunksize=chunk))
 
-        os.makedirs(train_dir, exist_ok=True)
-        os.makedirs(val_dir, exist_ok=True)
 
-        random.shuffle(imgs)
-        split_idx = int(len(imgs) * ratio)
-        train_files = imgs[:split_idx]
-        val_files = imgs[split_idx:]
+def build_pipeline(src_root, dst_root, ratio, target_count,
+                   workers=None, seed=42, force=False, link="copy",
+                   decode=None):
+    """
+    Splits every class into train/val and balances train to target_count.
+    Copies and synthetic images are fanned out over a process pool; all
+    randomness is derived from (seed, class), so results match for any
+    number of workers. A manifest in dst_root lets re-runs skip outputs
+    whose source is unchanged and remove those whose source is gone.
+    'link' is copy, hard or sym: how source files land in train/val.
+    With 'decode' (a side length), synthetic images come from JPEGs
+    decoded at the smallest reduced scale still covering it.
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = find_classes(src_root, dst_root, ratio, seed)
+    manifest = Manifest(dst_root, {
+        "tool": "Augmentation", "src": os.path.abspath(src_root),
+        "ratio": ratio, "count": target_count, "seed": seed,
+        "decode": decode
+    })
+    how = {"copy": "Copy", "hard": "Hardlink", "sym": "Symlink"}[link]
+    target = (decode, decode) if decode else None
+    if force:
+        manifest.outputs = {}
+    start = time.perf_counter()
 
-        for f in val_files:
-            shutil.copy2(os.path.join(root, f), os.path.join(val_dir, f))
+    copies, tasks, planned = [], [], []
+    for job in jobs:
+        rel_path = job[1]
+        train_dir, train, val = plan_split(job)
+        print(f"[{rel_path}]: {len(train)} Train, {len(val)} Val")
+        for src, dst in train + val:
+            planned.append(dst)
+            if not manifest.fresh(src, dst, how):
+                copies.append((src, dst, link))
+            manifest.record(src, dst, how)
 
-        train_paths = []
-        for f in train_files:
-            dst_path = os.path.join(train_dir, f)
-            shutil.copy2(os.path.join(root, f), dst_path)
-            train_paths.append(dst_path)
+        if target_count and train:
+            train_src = dict((dst, src) for src, dst in train)
+            aug = plan_augments(
+                list(train_src), train_dir, target_count,
+                class_rng(seed, rel_path, "augment")
+            )
+            for rand_path, t_idx, save_path in aug:
+                src = train_src[rand_path]
+                name = AvailableTransforms[t_idx][1]
+                planned.append(save_path)
+                if not manifest.fresh(src, save_path, name):
+                    tasks.append((src, t_idx, save_path, target))
+                manifest.record(src, save_path, name)
+            print(f"[{rel_path}] Augmenting to {target_count} images.")
 
-        print(f"[{rel_path}]: {len(train_files)} Train, {len(val_files)} Val")
+    removed = manifest.prune(planned)
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        written = fan_out(pool, copy_one, copies, workers)
+        written += fan_out(pool, augment_one, tasks, workers)
+    finally:
+        if pool:
+            pool.shutdown()
+    manifest.save()
 
-        if target_count:
-            balance_directory(train_paths, train_dir, target_count)
-            print(f"[{rel_path}] Augmented to {target_count} images.")
+    skipped = len(planned) - len(copies) - len(tasks)
+    print(f"{skipped} outputs unchanged, {removed} stale outputs removed.")
+    elapsed = time.perf_counter() - start
+    rate = written / elapsed if elapsed > 0 else 0.0
+    print(f"{written} images in {elapsed:.2f}s "
+          f"({rate:.1f} images/s, {workers} workers)")
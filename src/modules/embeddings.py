@@ -0,0 +1,124 @@
+import numpy as np
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import BATCH_SIZE
+from .evaluation import prefetched
+
+
+EMBED_DIR = "embeddings"
+VECTORS = "vectors.npy"
+EMBED_INDEX = "embeddings.json"
+EMBED_BATCH = BATCH_SIZE * 8
+# rows scored per matmul: bounds query memory whatever the index size
+BLOCK = 65536
+
+
+def feature_model(model, tf):
+    """Keras model from the input to the last hidden Dense (256 units)."""
+    dense = [layer for layer in model.layers[:-1]
+             if isinstance(layer, tf.keras.layers.Dense)]
+    assert dense, "The model has no hidden Dense layer"
+    return tf.keras.Model(model.inputs, dense[-1].output)
+
+
+def unit_rows(x):
+    """Rows scaled to unit L2 norm, so a dot product is a cosine."""
+    x = np.asarray(x, np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def write_embeddings(out, items, names, labels, load, embed, dim,
+                     workers=4, meta=None):
+    """
+    Streams items through load (thread pool) and embed (EMBED_BATCH at a
+    time) into out/vectors.npy, a (N, dim) float16 memmap of unit
+    vectors, with their names and labels in out/embeddings.json.
+    Unreadable items are dropped. Returns the number of rows.
+    """
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, VECTORS)
+    tmp_path = os.path.join(out, "vectors.tmp.npy")
+    vectors = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.float16, shape=(len(items), dim)
+    )
+    kept_names, kept_labels = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk, arrays in prefetched(range(len(items)),
+                                        lambda i: load(items[i]), pool,
+                                        EMBED_BATCH):
+            ok = [(i, a) for i, a in zip(chunk, arrays) if a is not None]
+            if not ok:
+                continue
+            row = len(kept_names)
+            vectors[row:row + len(ok)] = unit_rows(
+                embed(np.stack([a for _, a in ok]))
+            )
+            kept_names += [names[i] for i, _ in ok]
+            kept_labels += [int(labels[i]) for i, _ in ok]
+            print(f"\rEmbedded {len(kept_names)} images", end="",
+                  flush=True)
+    print()
+    vectors.flush()
+    del vectors
+
+    n = len(kept_names)
+    if n < len(items):
+        trimmed = np.load(tmp_path, mmap_mode='r')[:n]
+        np.save(path + ".part.npy", trimmed)
+        del trimmed
+        os.replace(path + ".part.npy", path)
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    with open(os.path.join(out, EMBED_INDEX), 'w') as f:
+        json.dump(dict(meta or {}, dim=dim, paths=kept_names,
+                       labels=kept_labels), f)
+    return n
+
+
+class EmbeddingIndex:
+    """
+    Memory-mapped embedding matrix with brute-force cosine k-NN: the
+    rows are scored BLOCK at a time with one matrix product against all
+    queries, and only a running top-k per query is kept.
+    """
+
+    def __init__(self, path=EMBED_DIR):
+        index = os.path.join(path, EMBED_INDEX)
+        assert os.path.exists(index), f"'{index}' not found: run --embed"
+        with open(index, 'r') as f:
+            meta = json.load(f)
+        self.meta = meta
+        self.paths = meta["paths"]
+        self.labels = np.array(meta["labels"], np.int32)
+        self.vectors = np.load(os.path.join(path, VECTORS), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.paths)
+
+    def query(self, queries, k=5, block=BLOCK):
+        """(indices, cosine similarities), both (Q, k), best first."""
+        q = unit_rows(queries)
+        k = min(k, len(self))
+        best_s = np.empty((len(q), 0), np.float32)
+        best_i = np.empty((len(q), 0), np.int64)
+        for start in range(0, len(self), block):
+            rows = self.vectors[start:start + block].astype(np.float32)
+            scores = q @ rows.T
+            cand_s = np.concatenate([best_s, scores], axis=1)
+            cand_i = np.concatenate([
+                best_i,
+                np.broadcast_to(np.arange(start, start + len(rows)),
+                                scores.shape)
+            ], axis=1)
+            if cand_s.shape[1] > k:
+                top = np.argpartition(-cand_s, k - 1, axis=1)[:, :k]
+                cand_s = np.take_along_axis(cand_s, top, axis=1)
+                cand_i = np.take_along_axis(cand_i, top, axis=1)
+            best_s, best_i = cand_s, cand_i
+        order = np.argsort(-best_s, axis=1)
+        return np.take_along_axis(best_i, order, axis=1), \
+            np.take_along_axis(best_s, order, axis=1)
@@ -0,0 +1,152 @@
+import numpy as np
+import json
+import time
+
+from .config import BATCH_SIZE, CYAN, GREEN, RED, RESET
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def prefetched(items, load, pool, size=BATCH_SIZE):
+    """
+    Shards 'items' into chunks of 'size' and yields (chunk, loaded) with
+    load(item) run on 'pool'. The next chunk is already decoding while
+    the caller scores the current one, and only two chunks are ever in
+    memory.
+    """
+    def submit(chunk):
+        return chunk, [pool.submit(load, item) for item in chunk]
+
+    it = chunked(items, size)
+    nxt = next(it, None)
+    pending = submit(nxt) if nxt else None
+    while pending:
+        chunk, futures = pending
+        nxt = next(it, None)
+        pending = submit(nxt) if nxt else None
+        yield chunk, [f.result() for f in futures]
+
+
+class Evaluation:
+    """
+    Confusion-matrix counts, summed log-loss and timing aggregated one
+    batch at a time, so a directory of any size is scored in bounded
+    memory. Rows are true classes, columns predictions.
+    """
+
+    def __init__(self, class_names):
+        self.class_names = class_names
+        n = len(class_names)
+        self.confusion = np.zeros((n, n), np.int64)
+        self.loss = 0.0
+        self.skipped = 0
+        self.start = time.perf_counter()
+        self.wall = 0.0
+
+    def add(self, probs, labels):
+        n = len(self.class_names)
+        labels = np.asarray(labels, np.int64)
+        preds = np.argmax(probs, axis=1)
+        self.confusion += np.bincount(
+            labels * n + preds, minlength=n * n
+        ).reshape(n, n)
+        picked = probs[np.arange(len(labels)), labels]
+        self.loss -= float(np.sum(np.log(np.clip(picked, 1e-7, 1.0))))
+
+    def finish(self):
+        self.wall = time.perf_counter() - self.start
+        return self
+
+    @property
+    def count(self):
+        return int(self.confusion.sum())
+
+    def per_class(self):
+        """(precision, recall, f1, support) arrays; 0 where undefined."""
+        tp = np.diag(self.confusion).astype(np.float64)
+        predicted = self.confusion.sum(axis=0)
+        support = self.confusion.sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp),
+                              where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp),
+                           where=support > 0)
+        total = precision + recall
+        f1 = np.divide(2 * precision * recall, total,
+                       out=np.zeros_like(tp), where=total > 0)
+        return precision, recall, f1, support
+
+    def confused(self, k=5):
+        """The k largest off-diagonal cells as (true, predicted, count)."""
+        off = self.confusion.copy()
+        np.fill_diagonal(off, 0)
+        flat = np.argsort(off, axis=None)[::-1][:k]
+        n = len(self.class_names)
+        return [(self.class_names[i // n], self.class_names[i % n],
+                 int(off.flat[i])) for i in flat if off.flat[i]]
+
+    def report(self, **extra):
+        count = self.count
+        precision, recall, f1, support = self.per_class()
+        seen = support > 0
+        return dict(extra, **{
+            "images": count,
+            "skipped": self.skipped,
+            "accuracy": float(np.trace(self.confusion) / count)
+            if count else 0.0,
+            "loss": self.loss / count if count else 0.0,
+            "macro_f1": float(f1[seen].mean()) if seen.any() else 0.0,
+            "wall_s": round(self.wall, 4),
+            "images_per_s": round(count / self.wall, 1)
+            if self.wall else 0.0,
+            "classes": {
+                name: {"precision": round(float(precision[i]), 4),
+                       "recall": round(float(recall[i]), 4),
+                       "f1": round(float(f1[i]), 4),
+                       "support": int(support[i])}
+                for i, name in enumerate(self.class_names)
+            },
+            "top_confused": [
+                {"true": t, "predicted": p, "count": c}
+                for t, p, c in self.confused()
+            ],
+            "confusion": self.confusion.tolist()
+        })
+
+
+def print_report(report, src):
+    print(f"\n'{src}':\t Accuracy = {GREEN}[{report['accuracy']*100:.2f}%]",
+          end="")
+    print(f"\t{RESET} Loss = {RED}[{report['loss']:.4f}]{RESET}")
+
+    width = max([len(n) for n in report["classes"]] + [5])
+    print(CYAN + f"\n{'CLASS':<{width}}{'precision':>11}{'recall':>9}"
+          f"{'f1':>8}{'support':>9}" + RESET)
+    for name, c in report["classes"].items():
+        print(f"{name:<{width}}{c['precision'] * 100:>10.2f}%"
+              f"{c['recall'] * 100:>8.2f}%{c['f1'] * 100:>7.2f}%"
+              f"{c['support']:>9}")
+    print(f"{'macro F1':<{width}}{report['macro_f1'] * 100:>28.2f}%")
+
+    if report["top_confused"]:
+        print(CYAN + "\nTOP CONFUSED (true -> predicted):" + RESET)
+        for pair in report["top_confused"]:
+            print(f"  {pair['true']} -> {pair['predicted']}: "
+                  f"{pair['count']}")
+    print(f"\n{report['images']} images in {report['wall_s']:.2f}s "
+          f"({report['images_per_s']:.1f} images/s)")
+    if report["skipped"]:
+        print(f"{report['skipped']} unreadable images skipped.")
+
+
+def write_report(report, out):
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,136 @@
+import struct
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import IMAGE_EXTS
+
+
+INDEX = ".leaf_index.json"
+
+
+def jpeg_size(f):
+    """Walks JPEG markers up to the first SOFn frame header."""
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+            continue
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        length = struct.unpack('>H', seg)[0]
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack('>HH', data[1:5])
+            return w, h
+        f.seek(length - 2, 1)
+
+
+def read_header(path):
+    """(format, width, height) from the file header, None if invalid."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(26)
+            if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+                w, h = struct.unpack('>II', head[16:24])
+                return "png", w, h
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                w, h = struct.unpack('<HH', head[6:10])
+                return "gif", w, h
+            if head[:2] == b'BM':
+                w, h = struct.unpack('<ii', head[18:26])
+                return "bmp", w, abs(h)
+            if head[:4] in (b'II*\x00', b'MM\x00*'):
+                return "tiff", 0, 0
+            if head[:2] == b'\xff\xd8':
+                f.seek(0)
+                size = jpeg_size(f)
+                f.seek(max(0, os.fstat(f.fileno()).st_size - 1024))
+                if size and b'\xff\xd9' in f.read():
+                    return "jpeg", size[0], size[1]
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def describe(job):
+    path, size = job
+    header = read_header(path) if size > 0 else None
+    if header is None:
+        return {"valid": False}
+    fmt, w, h = header
+    return {"valid": w > 0 or fmt == "tiff", "format": fmt,
+            "width": w, "height": h}
+
+
+def scan_class(path):
+    """{name: (mtime_ns, size)} via os.scandir, no isfile/listdir stats."""
+    files = {}
+    with os.scandir(path) as entries:
+        for e in entries:
+            if e.name.lower().endswith(IMAGE_EXTS) and e.is_file():
+                st = e.stat()
+                files[e.name] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+def build_index(dir, workers=16, rescan=False):
+    """
+    Image index of dir/<class>/<file>: size, format, dimensions and
+    validity read from headers in a thread pool. Cached next to the
+    data in .leaf_index.json. Every file is stat'ed on each run (one
+    DirEntry.stat() each), so in-place rewrites, which keep the class
+    directory's mtime, are caught too; only new or changed files have
+    their headers read again, and 'rescan' re-reads them all.
+    """
+    path = os.path.join(dir, INDEX)
+    old = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            old = json.load(f)
+
+    index = {}
+    jobs = []
+    changed = False
+    with os.scandir(dir) as top:
+        subs = [e for e in top if e.is_dir() and not e.name.startswith('.')]
+    for sub in subs:
+        prev_files = old.get(sub.name, {}).get("files", {})
+        entries = {}
+        for name, (mtime, size) in scan_class(sub.path).items():
+            rec = prev_files.get(name)
+            if not rescan and rec and rec["mtime"] == mtime and \
+                    rec["size"] == size:
+                entries[name] = rec
+            else:
+                entries[name] = {"mtime": mtime, "size": size}
+                jobs.append((sub.name, name))
+        changed |= set(entries) != set(prev_files)
+        index[sub.name] = {"files": entries}
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            infos = pool.map(describe, [
+                (os.path.join(dir, c, n), index[c]["files"][n]["size"])
+                for c, n in jobs
+            ])
+            for (cls, name), info in zip(jobs, infos):
+                index[cls]["files"][name].update(info)
+
+    if jobs or changed or set(old) != set(index):
+        try:
+            with open(path + ".tmp", 'w') as f:
+                json.dump(index, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+    return {cls: entry["files"] for cls, entry in index.items()}
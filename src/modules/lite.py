@@ -0,0 +1,99 @@
+import numpy as np
+import resource
+import os
+
+
+LITE_MODEL = "leaf_model.tflite"
+
+
+def rss_mb():
+    """Current resident set size (peak where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def interpreter_class():
+    """The lightest TFLite interpreter installed, TensorFlow's last."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def export_tflite(model, path=LITE_MODEL, calibration=None):
+    """
+    Converts a Keras model to TFLite. With 'calibration' (an iterable of
+    float32 image batches) weights and activations are quantized to
+    int8; input and output stay float32 so callers need no changes.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration is not None:
+        def representative():
+            for batch in calibration:
+                for img in np.asarray(batch, np.float32):
+                    yield [img[None]]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8
+        ]
+    data = converter.convert()
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+class LiteModel:
+    """
+    TFLite interpreter behind the one call predict.py makes on a Keras
+    model: predict(batch, verbose=0). The input is resized to each new
+    batch size, so full and ragged last batches both work.
+    """
+
+    def __init__(self, path=LITE_MODEL, threads=None):
+        assert os.path.exists(path), f"'{path}' not found!"
+        self.interpreter = interpreter_class()(
+            model_path=path, num_threads=threads or os.cpu_count()
+        )
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.shape = None
+
+    def quantize(self, batch, details):
+        scale, zero = details["quantization"]
+        if details["dtype"] in (np.int8, np.uint8) and scale:
+            info = np.iinfo(details["dtype"])
+            q = np.round(batch / scale + zero)
+            return np.clip(q, info.min, info.max).astype(details["dtype"])
+        return batch.astype(details["dtype"])
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        batch = np.asarray(batch, np.float32)
+        if batch.shape != self.shape:
+            self.interpreter.resize_tensor_input(
+                self.input["index"], batch.shape
+            )
+            self.interpreter.allocate_tensors()
+            self.input = self.interpreter.get_input_details()[0]
+            self.output = self.interpreter.get_output_details()[0]
+            self.shape = batch.shape
+        self.interpreter.set_tensor(
+            self.input["index"], self.quantize(batch, self.input)
+        )
+        self.interpreter.invoke()
+        out = self.interpreter.get_tensor(self.output["index"])
+        scale, zero = self.output["quantization"]
+        if out.dtype in (np.int8, np.uint8) and scale:
+            return (out.astype(np.float32) - zero) * scale
+        return out.copy()
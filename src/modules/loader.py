@@ -0,0 +1,65 @@
+
+import numpy as np
+import io
+
+from .index import read_header, jpeg_size
+
+
+# libjpeg scales in the DCT domain: 1/8 of the pixels per halving
+REDUCED = (8, 4, 2)
+
+
+def read_flag(factor):
+    """cv2 imread/imdecode flag decoding colour at 1/factor scale."""
+    import cv2
+    return {
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        2: cv2.IMREAD_REDUCED_COLOR_2
+    }.get(factor, cv2.IMREAD_COLOR)
+
+
+def scale_for(width, height, target):
+    """
+    Largest reduction (8, 4, 2 or 1) whose output still covers target
+    (w, h). Sides are compared against the larger target side so an
+    EXIF rotation can never leave the result too small.
+    """
+    need = max(target)
+    for factor in REDUCED:
+        if min(width, height) // factor >= need:
+            return factor
+    return 1
+
+
+def imread(path, target=None):
+    """
+    cv2.imread (BGR), except that a JPEG is decoded at 1/2, 1/4 or 1/8
+    scale when the result still covers target: callers that resize down
+    to target anyway skip 4-64x the decode and pixel work. Other formats,
+    and JPEGs already close to target, are decoded at full size.
+    """
+    import cv2
+    if target:
+        header = read_header(path)
+        if header and header[0] == "jpeg":
+            factor = scale_for(header[1], header[2], target)
+            if factor > 1:
+                img = cv2.imread(path, read_flag(factor))
+                if img is not None:
+                    return img
+    return cv2.imread(path)
+
+
+def imdecode(data, target=None):
+    """imread for encoded bytes: the same reduced JPEG decode rule."""
+    import cv2
+    buf = np.frombuffer(data, np.uint8)
+    if target and data[:2] == b'\xff\xd8':
+        size = jpeg_size(io.BytesIO(data))
+        factor = scale_for(size[0], size[1], target) if size else 1
+        if factor > 1:
+            img = cv2.imdecode(buf, read_flag(factor))
+            if img is not None:
+                return img
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
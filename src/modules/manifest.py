@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+
+
+MANIFEST = ".leaf_manifest.json"
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Index of every output written into 'dst': which source it came from,
+    that source's mtime/size/sha1 and the transform that produced it.
+    Lets re-runs skip unchanged work and drop outputs of deleted sources.
+    'params' covers run-wide settings; changing them invalidates all.
+    """
+
+    def __init__(self, dst, params=None):
+        self.dst = dst
+        self.path = os.path.join(dst, MANIFEST)
+        self.params = params or {}
+        self.outputs = {}
+        self.stats = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get("params") == self.params:
+                self.outputs = data.get("outputs", {})
+
+    def source_info(self, src, known=None):
+        """(mtime, size, sha1) of a source, hashing only if stat moved."""
+        if src not in self.stats:
+            st = os.stat(src)
+            if known and known["mtime"] == st.st_mtime and \
+                    known["size"] == st.st_size:
+                digest = known["sha1"]
+            else:
+                digest = file_digest(src)
+            self.stats[src] = (st.st_mtime, st.st_size, digest)
+        return self.stats[src]
+
+    def fresh(self, src, out_path, transform):
+        rel = os.path.relpath(out_path, self.dst)
+        entry = self.outputs.get(rel)
+        if not entry or entry["transform"] != transform or \
+                entry["src"] != os.path.abspath(src) or \
+                not os.path.exists(out_path):
+            return False
+        mtime, size, digest = self.source_info(src, entry)
+        return digest == entry["sha1"]
+
+    def record(self, src, out_path, transform):
+        mtime, size, digest = self.source_info(src)
+        self.outputs[os.path.relpath(out_path, self.dst)] = {
+            "src": os.path.abspath(src), "mtime": mtime, "size": size,
+            "sha1": digest, "transform": transform
+        }
+
+    def prune(self, keep, scope=None):
+        """
+        Deletes recorded outputs that this run did not produce.
+        'scope(entry)' limits which entries this run is responsible for.
+        """
+        keep = {os.path.relpath(p, self.dst) for p in keep}
+        stale = [
+            rel for rel, entry in self.outputs.items()
+            if rel not in keep and (scope is None or scope(entry))
+        ]
+        removed = 0
+        for rel in stale:
+            path = os.path.join(self.dst, rel)
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+            del self.outputs[rel]
+        return removed
+
+    def save(self):
+        os.makedirs(self.dst, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"params": self.params, "outputs": self.outputs}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,104 @@
+import numpy as np
+import time
+
+from .config import CYAN, GREEN, YELLOW, RESET
+
+
+INPUT_BOUND = 0.5
+COMPUTE_BOUND = 0.1
+PROBE_BATCHES = 50
+
+
+class PipelineProbe:
+    """
+    Benchmarks a tf.data pipeline on its own: next() on iter(ds) is
+    timed directly for up to 'batches' batches, with nothing wrapped
+    around the dataset training uses. The first batch (shuffle buffer,
+    cache open) is warm-up and not counted. Run it once the first epoch
+    has filled any .cache(), so it times what later epochs read.
+    """
+
+    def __init__(self, batches=PROBE_BATCHES):
+        self.batches = batches
+        self.wait = 0.0
+        self.count = 0
+        self.samples = 0
+
+    def measure(self, ds):
+        it = iter(ds)
+        if next(it, None) is None:
+            return self
+        while self.count < self.batches:
+            t = time.perf_counter()
+            try:
+                _, y = next(it)
+            except StopIteration:
+                break
+            self.wait += time.perf_counter() - t
+            self.count += 1
+            self.samples += int(y.shape[0])
+        return self
+
+    @property
+    def batch_ms(self):
+        return self.wait / self.count * 1000 if self.count else 0.0
+
+    @property
+    def images_per_s(self):
+        return self.samples / self.wait if self.wait else 0.0
+
+    def record(self):
+        return {"batches": self.count, "batch_ms": round(self.batch_ms, 3),
+                "images_per_s": round(self.images_per_s, 1)}
+
+
+def verdict(wait_share):
+    if wait_share >= INPUT_BOUND:
+        return ("input pipeline", YELLOW,
+                "try -cache, a split manifest on local disk or more "
+                "parallel decode; a faster model will not help")
+    if wait_share <= COMPUTE_BOUND:
+        return ("compute", GREEN,
+                "the pipeline keeps up; try -profile (oneDNN, bf16, XLA) "
+                "or more threads")
+    return ("mixed", YELLOW,
+            "both sides matter; cache the input first, then tune compute")
+
+
+def wait_split(epoch, probe):
+    """
+    data_wait_ms and wait_share of one epoch entry: the warm pipeline's
+    own ms/batch over the epoch's ms/step estimates the share of each
+    step spent waiting for data, capped at the whole step.
+    """
+    step_ms = epoch["train_s"] / epoch["steps"] * 1000 \
+        if epoch["steps"] else 0.0
+    share = min(probe.batch_ms / step_ms, 1.0) \
+        if step_ms and probe.count else 0.0
+    return {"data_wait_ms": round(share * step_ms, 3),
+            "wait_share": round(share, 3)}
+
+
+def summary(epochs, probe=None):
+    """
+    Averages every epoch after the first (tracing, cache filling) and
+    names the bottleneck from their wait_share (see wait_split).
+    """
+    steady = epochs[1:] or epochs
+    steps = sum(e["steps"] for e in steady) or 1
+    busy = sum(e["train_s"] for e in steady)
+    rate = sum(e["samples"] for e in steady) / busy if busy else 0.0
+    step_ms = busy / steps * 1000
+    print(CYAN + "\nTHROUGHPUT:" + RESET)
+    print(f"{step_ms:.1f} ms/step (p50 "
+          f"{np.median([e['step_ms_p50'] for e in steady]):.1f}), "
+          f"{rate:.1f} images/s over {len(steady)} epoch(s)")
+    if not probe or not probe.count:
+        print("The input pipeline could not be probed: no verdict.")
+        return
+    share = float(np.mean([e["wait_share"] for e in steady]))
+    name, color, hint = verdict(share)
+    print(f"input pipeline alone {probe.batch_ms:.1f} ms/batch "
+          f"({probe.images_per_s:.1f} images/s): about {share * 100:.0f}% "
+          f"of a training step")
+    print(color + f"BOTTLENECK: {name}. " + RESET + hint + ".")
@@ -0,0 +1,84 @@
+import numpy as np
+import json
+import os
+
+from .config import IMG_HEIGHT, IMG_WIDTH
+from .loader import imread, imdecode
+from .transforms import get_plant_mask
+
+
+SIZE = (IMG_WIDTH, IMG_HEIGHT)
+SETTINGS = "preprocess.json"
+
+
+def mask_bgr(bgr):
+    """Background blacked out, in cv2's BGR decode order."""
+    import cv2
+    return cv2.bitwise_and(bgr, bgr, mask=get_plant_mask(bgr, bgr=True))
+
+
+def finish(bgr):
+    """Resize first, so the colour conversion only touches SIZE pixels."""
+    import cv2
+    return cv2.cvtColor(cv2.resize(bgr, SIZE), cv2.COLOR_BGR2RGB)
+
+
+def prepare(bgr, mask=True):
+    """
+    The one preprocessing graph of training, evaluation and serving:
+    decoded BGR -> leaf mask -> resize -> uint8 RGB model input.
+    Normalizing is a float32 cast; the 1/255 rescale is the model's
+    first layer, so Keras and TFLite take the same 0-255 input.
+    """
+    return finish(mask_bgr(bgr) if mask else bgr)
+
+
+def prepare_path(path, mask=True, target=None):
+    """
+    decode -> prepare; None if unreadable. Full-size decode by default:
+    the leaf mask is resolution-dependent, so a reduced-scale decode
+    (target=SIZE) is opt-in and must be used the same way everywhere.
+    """
+    img = imread(path, target)
+    return None if img is None else prepare(img, mask)
+
+
+def prepare_bytes(data, mask=True, target=None):
+    """prepare_path for encoded bytes (HTTP uploads), same decode rule."""
+    img = imdecode(data, target)
+    return None if img is None else prepare(img, mask)
+
+
+def tf_images(tf, ds, mask=True):
+    """
+    Maps a tf.data stream of (path, label) to (uint8 image, label)
+    through prepare_path. cv2 releases the GIL, so the parallel map
+    calls run on all cores; unreadable files are dropped.
+    """
+    def load(path):
+        img = prepare_path(path.decode(), mask)
+        if img is None:
+            return np.zeros(SIZE[::-1] + (3,), np.uint8), False
+        return img, True
+
+    def run(path, label):
+        img, ok = tf.numpy_function(load, [path], (tf.uint8, tf.bool))
+        img.set_shape((IMG_HEIGHT, IMG_WIDTH, 3))
+        return img, label, ok
+
+    ds = ds.map(run, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.filter(lambda x, y, ok: ok).map(lambda x, y, ok: (x, y))
+
+
+def save_settings(mask, path=SETTINGS):
+    with open(path, 'w') as f:
+        json.dump({"mask": bool(mask), "height": IMG_HEIGHT,
+                   "width": IMG_WIDTH}, f)
+
+
+def load_settings(path=SETTINGS):
+    """Settings the model was trained with; {} for older models."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,201 @@
+import numpy as np
+import json
+import time
+import os
+
+from .config import CYAN, YELLOW, RESET
+from .monitor import PipelineProbe, summary, wait_split
+
+
+# threads: 0 lets TensorFlow pick. precision: float32 | bfloat16
+PROFILES = {
+    "default": {"onednn": False, "threads": 0, "inter_threads": 0,
+                "precision": "float32", "xla": False},
+    "onednn": {"onednn": True},
+    "bf16": {"onednn": True, "precision": "bfloat16"},
+    "xla": {"xla": True},
+    "fast": {"onednn": True, "precision": "bfloat16", "xla": True}
+}
+
+
+def load_profile(name, **overrides):
+    """
+    A named profile (or a .json file of the same keys) over the default
+    one, then every override that is not None.
+    """
+    profile = dict(PROFILES["default"])
+    if name.lower().endswith(".json"):
+        with open(name, 'r') as f:
+            profile.update(json.load(f))
+    else:
+        assert name in PROFILES, \
+            f"Unknown profile '{name}' ({', '.join(PROFILES)})"
+        profile.update(PROFILES[name])
+    profile.update({k: v for k, v in overrides.items() if v is not None})
+    unknown = set(profile) - set(PROFILES["default"])
+    assert not unknown, f"Unknown profile keys: {', '.join(sorted(unknown))}"
+    profile["name"] = os.path.basename(name)
+    return profile
+
+
+def cpu_has_bf16():
+    """Native bfloat16 arithmetic (AVX512-BF16 or AMX) on this CPU."""
+    try:
+        with open("/proc/cpuinfo", 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def apply_env(profile):
+    """
+    Settings read when TensorFlow is imported: call before importing.
+    bfloat16 runs through oneDNN kernels, so it turns oneDNN on; on a
+    CPU without native bfloat16 it falls back to float32.
+    """
+    if profile["precision"] == "bfloat16":
+        if cpu_has_bf16():
+            profile["onednn"] = True
+        else:
+            print(YELLOW + "No native bfloat16 on this CPU, "
+                  "using float32." + RESET)
+            profile["precision"] = "float32"
+    os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if profile["onednn"] else '0'
+
+
+def apply_tf(profile, tf):
+    """Thread pools, precision policy and XLA auto-clustering."""
+    if profile["threads"]:
+        tf.config.threading.set_intra_op_parallelism_threads(
+            profile["threads"]
+        )
+    if profile["inter_threads"]:
+        tf.config.threading.set_inter_op_parallelism_threads(
+            profile["inter_threads"]
+        )
+    if profile["precision"] == "bfloat16":
+        tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    tf.config.optimizer.set_jit(bool(profile["xla"]))
+
+
+def describe(profile):
+    return (f"profile '{profile['name']}': "
+            f"oneDNN {'on' if profile['onednn'] else 'off'}, "
+            f"threads {profile['threads'] or 'auto'}/"
+            f"{profile['inter_threads'] or 'auto'}, "
+            f"{profile['precision']}, XLA {'on' if profile['xla'] else 'off'}")
+
+
+class SampleCounter:
+    """
+    Samples a tf.data pipeline has produced, counted in-graph by a map
+    over its batches, so a ragged last batch counts what it holds.
+    """
+
+    def __init__(self, tf):
+        self.total = tf.Variable(0, dtype=tf.int64, trainable=False)
+
+    def wrap(self, ds, tf):
+        def count(x, y):
+            self.total.assign_add(tf.cast(tf.shape(y)[0], tf.int64))
+            return x, y
+        return ds.map(count)
+
+    def read(self):
+        return int(self.total.numpy())
+
+
+def epoch_timer(callbacks, profile, counter, log=None, probe_ds=None,
+                tf=None, trace=None, trace_steps=(10, 20)):
+    """
+    Keras callback timing every epoch: wall time (with validation), and
+    training steps, step-time percentiles, time and samples/s (samples
+    from the SampleCounter wrapping the training set). 'trace' (a log
+    dir, with tf) captures a TensorBoard profiler trace over the global
+    steps [start, stop). After the first epoch, once its caches are
+    filled, a PipelineProbe times 'probe_ds' (the uncounted training
+    set) alone, and every epoch gets data_wait_ms and wait_share from
+    it; monitor.summary names the bottleneck at the end. With 'log' it
+    appends one JSON line per run, so profiles can be compared on one
+    machine.
+    """
+    class EpochTimer(callbacks.Callback):
+        def on_train_begin(self, logs=None):
+            self.epochs = []
+            self.seen = counter.read()
+            self.step = 0
+            self.tracing = False
+            self.probe = None
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self.times = []
+            self.start = self.last = time.perf_counter()
+
+        def on_train_batch_begin(self, batch, logs=None):
+            if trace and self.step == trace_steps[0]:
+                tf.profiler.experimental.start(trace)
+                self.tracing = True
+            self.t = time.perf_counter()
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.last = time.perf_counter()
+            self.times.append(self.last - self.t)
+            self.step += 1
+            if self.tracing and self.step >= trace_steps[1]:
+                self.stop_trace()
+
+        def stop_trace(self):
+            tf.profiler.experimental.stop()
+            self.tracing = False
+            print(CYAN + f"Profiler trace of steps {trace_steps[0]}-"
+                  f"{self.step} saved to '{trace}'." + RESET)
+
+        def on_epoch_end(self, epoch, logs=None):
+            wall = time.perf_counter() - self.start
+            train = self.last - self.start
+            total = counter.read()
+            samples, self.seen = total - self.seen, total
+            times = self.times or [0.0]
+            self.epochs.append({
+                "epoch": epoch + 1, "wall_s": round(wall, 3),
+                "train_s": round(train, 3), "steps": len(self.times),
+                "step_ms_p50": round(float(np.median(times)) * 1000, 3),
+                "step_ms_p90": round(
+                    float(np.percentile(times, 90)) * 1000, 3
+                ),
+                "samples": samples,
+                "samples_per_s": round(samples / train, 1) if train else 0.0,
+                "val_accuracy": float((logs or {}).get("val_accuracy", 0))
+            })
+            if epoch == 0 and probe_ds is not None:
+                self.probe = PipelineProbe().measure(probe_ds)
+                print(f"Input pipeline alone: {self.probe.batch_ms:.1f} "
+                      f"ms/batch, {self.probe.images_per_s:.1f} images/s")
+            if self.probe:
+                for e in self.epochs:
+                    e.update(wait_split(e, self.probe))
+            print(f"[{profile['name']}] epoch {epoch + 1}: {wall:.2f}s, "
+                  f"{self.epochs[-1]['samples_per_s']:.1f} samples/s")
+
+        def on_train_end(self, logs=None):
+            if self.tracing:
+                self.stop_trace()
+            if not self.epochs:
+                return
+            steady = self.epochs[1:] or self.epochs
+            rate = sum(e["samples_per_s"] for e in steady) / len(steady)
+            print(f"{describe(profile)}\n"
+                  f"first epoch {self.epochs[0]['wall_s']:.2f}s, "
+                  f"steady {rate:.1f} samples/s")
+            summary(self.epochs, self.probe)
+            if log:
+                with open(log, 'a') as f:
+                    f.write(json.dumps({
+                        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "profile": profile, "epochs": self.epochs,
+                        "steady_samples_per_s": round(rate, 1),
+                        "probe": self.probe.record() if self.probe
+                        else None
+                    }) + "\n")
+    return EpochTimer()
@@ -0,0 +1,159 @@
+import numpy as np
+import base64
+import json
+import html
+import io
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+CHANNELS = [
+    ('Red', 'red'), ('Green', 'green'), ('Blue', 'blue'),
+    ('Hue', 'purple'), ('Saturation', 'cyan'), ('Value', 'orange'),
+    ('Lightness', 'black'), ('Green-Magenta', 'magenta'),
+    ('Blue-Yellow', 'yellow')
+]
+OFFSETS = (np.arange(len(CHANNELS)) * 256).astype(np.intp)
+
+
+def image_histograms(img_rgb):
+    """(9, 256) pixel counts over RGB, HSV and LAB in one bincount."""
+    import cv2
+    stack = np.concatenate([
+        img_rgb,
+        cv2.cvtColor(img_rgb, cv2.COLOR_RGB2HSV),
+        cv2.cvtColor(img_rgb, cv2.COLOR_RGB2LAB)
+    ], axis=2).reshape(-1, len(CHANNELS))
+    idx = stack.astype(np.intp) + OFFSETS
+    counts = np.bincount(idx.ravel(), minlength=256 * len(CHANNELS))
+    return counts.reshape(len(CHANNELS), 256)
+
+
+def file_histograms(path, load=None):
+    import cv2
+    img = (load or cv2.imread)(path)
+    if img is None:
+        return None
+    return image_histograms(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+
+
+def dataset_histograms(paths, workers=8, load=None):
+    """
+    Streams every image through a thread pool into one running sum.
+    'load' turns an item of 'paths' into a BGR image (cv2.imread by
+    default, ShardReader.bgr for pack records).
+    """
+    total = np.zeros((len(CHANNELS), 256), np.int64)
+    used = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for hist in pool.map(lambda p: file_histograms(p, load), paths):
+            if hist is not None:
+                total += hist
+                used += 1
+    return total, used
+
+
+def size_histogram(index):
+    sizes = Counter()
+    for files in index.values():
+        for rec in files.values():
+            if rec.get("valid"):
+                sizes[f"{rec['width']}x{rec['height']}"] += 1
+    return dict(sizes.most_common())
+
+
+def build_report(dir, index, workers=8, reader=None):
+    """Report of a directory index, or of a pack through its reader."""
+    counts = {
+        cls: sum(1 for r in files.values() if r.get("valid"))
+        for cls, files in sorted(index.items())
+    }
+    invalid = {
+        cls: sum(1 for r in files.values() if not r.get("valid"))
+        for cls, files in sorted(index.items())
+    }
+    paths = [
+        rec["record"] if reader else os.path.join(dir, cls, name)
+        for cls, files in sorted(index.items())
+        for name, rec in sorted(files.items()) if rec.get("valid")
+    ]
+    load = reader.bgr if reader else None
+    hist, used = dataset_histograms(paths, workers, load)
+    pixels = hist[0].sum()
+    return {
+        "dir": dir,
+        "total": sum(counts.values()),
+        "counts": counts,
+        "invalid": invalid,
+        "sizes": size_histogram(index),
+        "histogram_images": used,
+        "histograms": {
+            name: (hist[i] / pixels * 100).round(5).tolist()
+            if pixels else hist[i].tolist()
+            for i, (name, _) in enumerate(CHANNELS)
+        }
+    }
+
+
+def figure_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def render_html(report):
+    """Agg-only rendering: no display is touched."""
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(1, 2, figsize=(12, 5))
+    names = list(report["counts"])
+    ax[0].bar(names, list(report["counts"].values()))
+    ax[0].set_title("Images per class")
+    ax[0].tick_params(axis='x', rotation=45)
+    sizes = list(report["sizes"].items())[:15]
+    ax[1].bar([s for s, _ in sizes], [c for _, c in sizes])
+    ax[1].set_title("Image sizes")
+    ax[1].tick_params(axis='x', rotation=45)
+    counts_png = figure_png(fig)
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+    for name, color in CHANNELS:
+        ax.plot(report["histograms"][name], color=color, label=name,
+                linewidth=1.2, alpha=0.7)
+    ax.set_title(f"Pixel Intensity Distribution "
+                 f"({report['histogram_images']} images)")
+    ax.set_xlabel("Pixel Intensity (0-255)")
+    ax.set_ylabel("Proportion of pixels (%)")
+    ax.set_xlim([0, 256])
+    ax.legend(loc='upper right')
+    ax.grid(True, linestyle='--', alpha=0.3)
+    hist_png = figure_png(fig)
+    plt.close(fig)
+
+    rows = "".join(
+        f"<tr><td>{html.escape(c)}</td><td>{n}</td>"
+        f"<td>{report['invalid'].get(c, 0)}</td></tr>"
+        for c, n in report["counts"].items()
+    )
+    return (
+        f"<html><head><meta charset='utf-8'><title>Leaffliction "
+        f"{html.escape(report['dir'])}</title></head><body>"
+        f"<h1>{html.escape(report['dir'])}: {report['total']} images</h1>"
+        f"<table border='1'><tr><th>Class</th><th>Images</th>"
+        f"<th>Invalid</th></tr>{rows}</table>"
+        f"<img src='data:image/png;base64,{counts_png}'/>"
+        f"<img src='data:image/png;base64,{hist_png}'/>"
+        f"</body></html>"
+    )
+
+
+def write_report(report, out):
+    with open(out, 'w') as f:
+        if out.lower().endswith((".html", ".htm")):
+            f.write(render_html(report))
+        else:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,97 @@
+import numpy as np
+from functools import lru_cache
+
+
+LOWER_GREEN = np.array([25, 40, 40])
+UPPER_GREEN = np.array([95, 255, 255])
+KERNEL = 5
+DOWNSCALE = 0.5
+
+
+def threshold_hsv(img, bgr=False):
+    import cv2
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV if bgr else cv2.COLOR_RGB2HSV)
+    return cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
+
+
+@lru_cache(maxsize=1)
+def green_lut():
+    """
+    16 MB table: packed 24-bit RGB -> 0/255, built once from the exact
+    HSV rule, so the lookup matches threshold_hsv bit for bit.
+    """
+    levels = np.arange(256, dtype=np.uint8)
+    b, g, r = np.meshgrid(levels, levels, levels, indexing='ij')
+    cube = np.stack([r, g, b], axis=-1).reshape(4096, 4096, 3)
+    return threshold_hsv(cube).reshape(-1)
+
+
+def threshold_lut(img, bgr=False):
+    """Colour threshold by table lookup, no HSV image is materialised."""
+    import cv2
+    rgba = cv2.cvtColor(img, cv2.COLOR_BGR2RGBA if bgr else cv2.COLOR_RGB2RGBA)
+    idx = rgba.view(np.uint32)[..., 0]
+    np.bitwise_and(idx, 0xFFFFFF, out=idx)
+    return green_lut().take(idx)
+
+
+def open_square(mask, size):
+    import cv2
+    kernel = np.ones((size, size), np.uint8)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+
+def open_separable(mask, size):
+    """Square opening as 1xk then kx1 passes: 2k instead of k*k taps."""
+    import cv2
+    row = np.ones((1, size), np.uint8)
+    col = np.ones((size, 1), np.uint8)
+    mask = cv2.erode(cv2.erode(mask, row), col)
+    return cv2.dilate(cv2.dilate(mask, row), col)
+
+
+def downscaled(threshold, morph, scale=DOWNSCALE):
+    """Masks a reduced copy and upsamples the mask (nearest)."""
+    def backend(img, bgr=False):
+        import cv2
+        h, w = img.shape[:2]
+        small = cv2.resize(
+            img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+        size = max(1, int(round(KERNEL * scale)) | 1)
+        mask = morph(threshold(small, bgr), size)
+        return cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+    return backend
+
+
+def reference(img, bgr=False):
+    return open_square(threshold_hsv(img, bgr), KERNEL)
+
+
+def lut(img, bgr=False):
+    return open_square(threshold_lut(img, bgr), KERNEL)
+
+
+def separable(img, bgr=False):
+    return open_separable(threshold_hsv(img, bgr), KERNEL)
+
+
+Backends = {
+    "reference": reference,
+    "lut":       lut,
+    "separable": separable,
+    "downscale": downscaled(threshold_hsv, open_square),
+    "fast":      downscaled(threshold_lut, open_separable)
+}
+
+
+def plant_mask(img, backend="reference", bgr=False):
+    assert backend in Backends, f"Unknown mask backend '{backend}'"
+    return Backends[backend](img, bgr)
+
+
+def iou(a, b):
+    a = a > 0
+    b = b > 0
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 1.0
@@ -0,0 +1,155 @@
+import numpy as np
+import threading
+import queue
+import json
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import BATCH_SIZE
+from .preprocess import prepare_bytes
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into batches of up to 'max_batch',
+    waiting at most 'max_wait' seconds after the first one arrives,
+    then runs a single model.predict for the whole batch.
+    """
+
+    def __init__(self, model, class_names, max_batch=BATCH_SIZE,
+                 max_wait=0.005, window=10000):
+        self.model = model
+        self.class_names = class_names
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.latencies = deque(maxlen=window)
+        self.batches = 0
+        self.served = 0
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def submit(self, array):
+        future = Future()
+        self.requests.put((array, future, time.perf_counter()))
+        return future
+
+    def collect(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def loop(self):
+        while True:
+            batch = self.collect()
+            try:
+                x = np.stack([a for a, _, _ in batch]).astype(np.float32)
+                preds = self.model.predict(x, verbose=0)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, t0), p in zip(batch, preds):
+                idx = int(np.argmax(p))
+                future.set_result({
+                    "class": self.class_names[idx],
+                    "confidence": float(p[idx] * 100)
+                })
+            with self.lock:
+                self.batches += 1
+                self.served += len(batch)
+                self.latencies.extend(
+                    (done - t0) * 1000 for _, _, t0 in batch
+                )
+
+    def stats(self):
+        with self.lock:
+            lat = np.array(self.latencies) if self.latencies else None
+            elapsed = time.perf_counter() - self.started
+            return {
+                "served": self.served,
+                "batches": self.batches,
+                "mean_batch": self.served / self.batches
+                if self.batches else 0.0,
+                "p50_ms": float(np.percentile(lat, 50))
+                if lat is not None else None,
+                "p99_ms": float(np.percentile(lat, 99))
+                if lat is not None else None,
+                "throughput": self.served / elapsed if elapsed else 0.0
+            }
+
+
+def make_handler(batcher, target=None):
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.reply(200, batcher.stats())
+            else:
+                self.reply(404, {"error": "use POST /predict or GET /stats"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.reply(404, {"error": "use POST /predict"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = 0
+            if length <= 0:
+                self.reply(400, {"error": "empty body: POST image bytes"})
+                return
+            try:
+                array = prepare_bytes(self.rfile.read(length), True, target)
+            except Exception:
+                array = None
+            if array is None:
+                self.reply(400, {"error": "could not decode image"})
+                return
+            try:
+                self.reply(200, batcher.submit(array).result())
+            except Exception as e:
+                self.reply(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(model, class_names, host, port, max_wait_ms, target=None):
+    """
+    Uploads go through preprocess.prepare_bytes with the decode 'target'
+    of predict.py -decode, as the CLI and batch paths do.
+    """
+    batcher = MicroBatcher(model, class_names, max_wait=max_wait_ms / 1000)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, target))
+    print(f"Serving on http://{host}:{port} "
+          f"(POST /predict, GET /stats, batch<={batcher.max_batch}, "
+          f"wait<={max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n" + json.dumps(batcher.stats()))
+    finally:
+        server.server_close()
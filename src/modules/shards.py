@@ -0,0 +1,201 @@
+import numpy as np
+import mmap
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import IMG_HEIGHT, IMG_WIDTH
+from .index import read_header
+from .loader import read_flag, scale_for
+from .preprocess import prepare, prepare_path
+
+
+PACK_VERSION = 1
+PACK_INDEX = "index.json"
+RECORDS = "records.npy"
+KINDS = ("jpeg", "array")
+# records.npy columns
+SHARD, OFFSET, LENGTH, LABEL, SPLIT = range(5)
+SPLITS = {"t": 0, "v": 1, "-": 2}
+
+
+def is_pack(path):
+    return os.path.isfile(os.path.join(path, PACK_INDEX)) and \
+        os.path.isfile(os.path.join(path, RECORDS))
+
+
+def read_meta(path):
+    with open(os.path.join(path, PACK_INDEX), 'r') as f:
+        return json.load(f)
+
+
+def pack_index(reader):
+    """
+    {class: {name: record}} view of a pack in the shape of
+    index.build_index, so Distribution.py reads a pack like a directory.
+    """
+    index = {name: {} for name in reader.classes}
+    for i, (name, (width, height)) in \
+            enumerate(zip(reader.names, reader.sizes)):
+        cls, base = name.split("/", 1)
+        files = index[cls]
+        key = base if base not in files else f"{base}#{i}"
+        files[key] = {"valid": True, "width": width, "height": height,
+                      "record": i}
+    return index
+
+
+def shard_name(i):
+    return f"shard-{i:05d}.bin"
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def pack(entries, classes, out, kind="jpeg", shard_mb=256, mask=False,
+         workers=8):
+    """
+    Writes (path, label, split flag) entries into a few large shards
+    plus an offset index: records.npy (shard, offset, size, label,
+    split) and index.json (classes, names, sizes, settings). 'jpeg'
+    keeps the original bytes; 'array' stores preprocessed uint8
+    (IMG_HEIGHT, IMG_WIDTH, 3) RGB images back to back. Sources are
+    read in order on a thread pool, so shards are written sequentially.
+    Unreadable files are skipped. Returns the number of records.
+    """
+    assert kind in KINDS, f"-kind must be one of {', '.join(KINDS)}"
+    assert not (mask and kind == "jpeg"), \
+        "-mask needs -kind array: jpeg packs keep the original bytes"
+    os.makedirs(out, exist_ok=True)
+    for f in os.listdir(out):
+        if f.startswith("shard-") or f in (PACK_INDEX, RECORDS):
+            os.remove(os.path.join(out, f))
+
+    if kind == "jpeg":
+        def load(entry):
+            data = read_bytes(entry[0])
+            header = read_header(entry[0])
+            return (data, header[1:]) if header else (None, None)
+    else:
+        def load(entry):
+            img = prepare_path(entry[0], mask)
+            return (None, None) if img is None else \
+                (img.tobytes(), (IMG_WIDTH, IMG_HEIGHT))
+
+    limit = shard_mb * 2**20
+    records, names, sizes = [], [], []
+    shard, offset, f = 0, 0, None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (path, label, split), (data, size) in \
+                zip(entries, pool.map(load, entries)):
+            if data is None:
+                continue
+            if f is None or (offset and offset + len(data) > limit):
+                if f:
+                    f.close()
+                    shard += 1
+                f = open(os.path.join(out, shard_name(shard)), 'wb')
+                offset = 0
+            f.write(data)
+            records.append((shard, offset, len(data), label, SPLITS[split]))
+            names.append(f"{classes[label]}/{os.path.basename(path)}")
+            sizes.append(list(size))
+            offset += len(data)
+    if f:
+        f.close()
+
+    np.save(os.path.join(out, RECORDS),
+            np.array(records, np.int64).reshape(-1, 5))
+    with open(os.path.join(out, PACK_INDEX), 'w') as f:
+        json.dump({
+            "version": PACK_VERSION, "kind": kind, "mask": bool(mask),
+            "height": IMG_HEIGHT, "width": IMG_WIDTH,
+            "classes": classes, "shards": shard + 1 if records else 0,
+            "names": names, "sizes": sizes
+        }, f, separators=(',', ':'))
+    return len(records)
+
+
+class ShardReader:
+    """
+    Memory-mapped view of a pack. Every shard is mapped once; 'jpeg'
+    records are decoded from the mapped bytes and 'array' records are
+    zero-copy uint8 views. Indexing with an array of record indices
+    returns a (N, H, W, 3) uint8 batch, so it can stand in for the
+    tensor cache in train.cached_dataset. Reads are thread-safe.
+    """
+
+    def __init__(self, path, mask=False):
+        assert is_pack(path), f"'{path}' is not a pack"
+        meta = read_meta(path)
+        assert meta.get("version") == PACK_VERSION, "Unsupported pack"
+        self.path = path
+        self.kind = meta["kind"]
+        self.masked = meta["mask"]
+        self.classes = meta["classes"]
+        self.names = meta["names"]
+        self.sizes = meta["sizes"]
+        self.records = np.load(os.path.join(path, RECORDS))
+        self.labels = self.records[:, LABEL].astype(np.int32)
+        assert not (mask and self.kind == "array" and not self.masked), \
+            "array pack was built without -mask; repack it with -mask"
+        self.mask = mask and not self.masked
+        self.maps = []
+        for i in range(meta["shards"]):
+            with open(os.path.join(path, shard_name(i)), 'rb') as f:
+                self.maps.append(
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                )
+
+    def __len__(self):
+        return len(self.records)
+
+    def select(self, part=None):
+        """Record indices of 'train' / 'val' (all when unsplit), in
+        shard and offset order so reads stay sequential."""
+        idx = np.arange(len(self.records))
+        if part:
+            flags = self.records[:, SPLIT]
+            if (flags != SPLITS["-"]).any():
+                idx = idx[flags == SPLITS[part[0]]]
+        return idx
+
+    def raw(self, i):
+        shard, offset, size = self.records[i, :3]
+        return self.maps[shard][offset:offset + size]
+
+    def bgr(self, i, target=None):
+        """
+        Decoded (jpeg) or stored (array) image in cv2's BGR order. With
+        a target, JPEGs decode at reduced scale as loader.imread does.
+        """
+        import cv2
+        if self.kind == "array":
+            return cv2.cvtColor(self.image(i), cv2.COLOR_RGB2BGR)
+        factor = scale_for(*self.sizes[i], target) if target else 1
+        return cv2.imdecode(np.frombuffer(self.raw(i), np.uint8),
+                            read_flag(factor))
+
+    def image(self, i, target=None):
+        """
+        Model input: uint8 (IMG_HEIGHT, IMG_WIDTH, 3) RGB. JPEGs decode
+        at full size unless a target is given, as in prepare_path.
+        """
+        if self.kind == "array":
+            shard, offset, _ = self.records[i, :3]
+            return np.frombuffer(
+                self.maps[shard], np.uint8, IMG_HEIGHT * IMG_WIDTH * 3,
+                int(offset)
+            ).reshape(IMG_HEIGHT, IMG_WIDTH, 3)
+        img = self.bgr(i, target)
+        return None if img is None else prepare(img, self.mask)
+
+    def __getitem__(self, idx):
+        return np.stack([self.image(i) for i in np.atleast_1d(idx)])
+
+    def close(self):
+        for m in self.maps:
+            m.close()
+        self.maps = []
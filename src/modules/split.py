@@ -0,0 +1,133 @@
+import hashlib
+import shutil
+import json
+import os
+
+from .config import IMAGE_EXTS
+
+
+SPLIT_VERSION = 1
+LINKS = ("copy", "hard", "sym")
+SPLIT_KEYS = ("root", "classes", "paths", "labels", "splits")
+
+
+def splitter(seed, ratio):
+    """
+    rel_path -> 'train' or 'val' from a hash of (seed, path): stable
+    across runs and machines, and unaffected by files being added to or
+    removed from the class, so a re-split only moves what changed.
+    """
+    base = hashlib.blake2b(f"{seed}:".encode(), digest_size=8)
+    cut = int(ratio * 2**64)
+
+    def assign(rel_path):
+        h = base.copy()
+        h.update(rel_path.replace(os.sep, '/').encode())
+        return "train" if int.from_bytes(h.digest(), 'big') < cut else "val"
+    return assign
+
+
+def list_classes(src_root):
+    """{class: ['class/sub/file', ...]} of src_root/<class>/**, sorted."""
+    classes = {}
+    with os.scandir(src_root) as top:
+        dirs = sorted(e.name for e in top
+                      if e.is_dir() and not e.name.startswith('.'))
+    for name in dirs:
+        files = []
+        for root, subdirs, fs in os.walk(os.path.join(src_root, name)):
+            subdirs.sort()
+            prefix = os.path.relpath(root, src_root).replace(os.sep, '/')
+            files += [f"{prefix}/{f}" for f in sorted(fs)
+                      if f.lower().endswith(IMAGE_EXTS)]
+        if files:
+            classes[name] = files
+    return classes
+
+
+def build_split(src_root, ratio=0.8, seed=42):
+    """
+    Compact split manifest of src_root: one entry per file with its
+    class index and split, stored column-wise (paths, labels and a
+    't'/'v' string). No file is read, copied or moved.
+    """
+    assert os.path.isdir(src_root), f"Cannot find '{src_root}'"
+    classes = list_classes(src_root)
+    assign = splitter(seed, ratio)
+    paths, labels, splits = [], [], []
+    for label, name in enumerate(classes):
+        paths += classes[name]
+        labels += [label] * len(classes[name])
+        splits += [assign(rel)[0] for rel in classes[name]]
+    return {
+        "version": SPLIT_VERSION,
+        "root": os.path.abspath(src_root),
+        "seed": seed,
+        "ratio": ratio,
+        "classes": list(classes),
+        "paths": paths,
+        "labels": labels,
+        "splits": "".join(splits)
+    }
+
+
+def save_split(split, path):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(split, f, separators=(',', ':'))
+    os.replace(path + ".tmp", path)
+
+
+def is_split(path):
+    """A .json file holding a split manifest of this version."""
+    if not (os.path.isfile(path) and path.lower().endswith(".json")):
+        return False
+    try:
+        with open(path, 'r') as f:
+            split = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(split, dict) and \
+        split.get("version") == SPLIT_VERSION and \
+        all(k in split for k in SPLIT_KEYS)
+
+
+def load_split(path):
+    with open(path, 'r') as f:
+        split = json.load(f)
+    assert split.get("version") == SPLIT_VERSION, \
+        f"'{path}' is not a split manifest"
+    return split
+
+
+def listing(split, part):
+    """(class_names, [(path relative to root, label)]) of one split."""
+    flag = part[0]
+    entries = [
+        (p, lbl) for p, lbl, s in
+        zip(split["paths"], split["labels"], split["splits"]) if s == flag
+    ]
+    return split["classes"], entries
+
+
+def counts(split):
+    """{class: (train, val)} file counts."""
+    out = {name: [0, 0] for name in split["classes"]}
+    for label, s in zip(split["labels"], split["splits"]):
+        out[split["classes"][label]][s == "v"] += 1
+    return {name: tuple(c) for name, c in out.items()}
+
+
+def place(src, dst, link="copy"):
+    """Copy, hardlink or symlink src to dst; hard falls back to copy."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if link == "sym":
+        os.symlink(os.path.abspath(src), dst)
+        return
+    if link == "hard":
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import re
+
+from .config import CYAN, RESET
+
+
+FLAG = "--profile-startup"
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)),
+                         len(m.group(3)) // 2))
+    return rows
+
+
+def profile_startup(top=15):
+    """
+    Re-runs the current command under 'python -X importtime' (without
+    the profiling flag) and prints the slowest top-level imports.
+    Returns the child's exit code.
+    """
+    argv = [a for a in sys.argv if a != FLAG]
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + argv,
+        stderr=subprocess.PIPE, text=True
+    )
+    rows = parse_importtime(proc.stderr)
+    roots = sorted((r for r in rows if r[3] == 0),
+                   key=lambda r: r[2], reverse=True)
+    total = sum(r[2] for r in roots)
+    print(CYAN + f"\nIMPORT TIME ({total / 1000:.0f} ms total):" + RESET)
+    for name, _, cumulative, _ in roots[:top]:
+        print(f"{cumulative / 1000:>9.1f} ms  {name}")
+    return proc.returncode
@@ -1,102 +1,135 @@
-import numpy as np
-import cv2
 
+from .config import MASK_BACKEND
+from .segment import plant_mask
 
-def get_plant_mask(img):
+
+# bump when a transform's output changes: invalidates -dst manifests
+TRANSFORM_VERSION = 1
+
+
+def get_plant_mask(img, bgr=False):
     """
     Helper: Creates a binary mask where white = leaf, black = background.
-    Used by ROI, Analyze, and Landmarks.
+    Used by LeafAnalysis, shared by Mask, ROI, Analyze and Landmarks.
+    The backend is picked by config.MASK_BACKEND.
     """
-    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-    lower_green = np.array([25, 40, 40])
-    upper_green = np.array([95, 255, 255])
+    return plant_mask(img, MASK_BACKEND, bgr)
 
-    mask = cv2.inRange(hsv, lower_green, upper_green)
-    kernel = np.ones((5, 5), np.uint8)
-    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
 
+class LeafAnalysis:
+    """
+    One segmentation pass per image, shared by every transform:
+    mask, largest contour, its bounding box and the pseudolandmarks.
+    'bgr' marks images kept in cv2's decode order; drawing follows it.
+    """
 
-def apply_mask(img):
+    def __init__(self, img, bgr=False):
+        import cv2
+        self.bgr = bgr
+        self.mask = get_plant_mask(img, bgr)
+        cnts, _ = cv2.findContours(
+            self.mask, cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE
+        )
+        self.contour = max(cnts, key=cv2.contourArea) if cnts else None
+        if self.contour is None:
+            self.bbox = None
+            self.landmarks = []
+        else:
+            self.bbox = cv2.boundingRect(self.contour)
+            self.landmarks = [tuple(p[0]) for p in self.contour[::20]]
+
+    def color(self, rgb):
+        return rgb[::-1] if self.bgr else rgb
+
+
+def apply_mask(img, leaf=None):
     """
     Fig IV.3: Mask
     Keeps the original leaf colors but blacks out the background.
     """
-    binary_mask = get_plant_mask(img)
+    import cv2
+    binary_mask = leaf.mask if leaf else get_plant_mask(img)
     return cv2.bitwise_and(img, img, mask=binary_mask)
 
 
-def apply_roi(img):
+def apply_roi(img, leaf=None):
     """
     Fig IV.4: Region of Interest. Draws a box around the leaf.
     """
+    import cv2
     out = img.copy()
-    mask = get_plant_mask(img)
-    cnts, _ = cv2.findContours(
-        mask, cv2.RETR_EXTERNAL,
-        cv2.CHAIN_APPROX_SIMPLE
-    )
-
-    if cnts:
-        c = max(cnts, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(c)
-        cv2.rectangle(out, (x, y), (x + w, y + h), (255, 0, 0), 3)
+    leaf = leaf or LeafAnalysis(img)
+    if leaf.bbox:
+        x, y, w, h = leaf.bbox
+        cv2.rectangle(out, (x, y), (x + w, y + h), leaf.color((255, 0, 0)), 3)
     return out
 
 
-def apply_analyze(img):
+def apply_analyze(img, leaf=None):
     """
     Fig IV.5: Analyze Object. Traces the outline (contour) of the leaf.
     """
+    import cv2
     out = img.copy()
-    mask = get_plant_mask(img)
-    cnts, _ = cv2.findContours(
-        mask, cv2.RETR_EXTERNAL,
-        cv2.CHAIN_APPROX_SIMPLE
-    )
-
-    if cnts:
-        c = max(cnts, key=cv2.contourArea)
-        cv2.drawContours(out, [c], -1, (0, 255, 0), 3)
+    leaf = leaf or LeafAnalysis(img)
+    if leaf.contour is not None:
+        cv2.drawContours(out, [leaf.contour], -1, leaf.color((0, 255, 0)), 3)
     return out
 
 
-def apply_landmarks(img):
+def apply_landmarks(img, leaf=None):
     """
     Fig IV.6: Pseudolandmarks. Plots points along the leaf structure.
     """
+    import cv2
     out = img.copy()
-    mask = get_plant_mask(img)
-    cnts, _ = cv2.findContours(
-        mask, cv2.RETR_EXTERNAL,
-        cv2.CHAIN_APPROX_SIMPLE
-    )
-
-    if cnts:
-        c = max(cnts, key=cv2.contourArea)
-        for i, point in enumerate(c):
-            if i % 20 == 0:
-                x, y = point[0]
-                cv2.circle(out, (x, y), 5, (0, 0, 255), -1)
+    leaf = leaf or LeafAnalysis(img)
+    for x, y in leaf.landmarks:
+        cv2.circle(out, (int(x), int(y)), 5, leaf.color((0, 0, 255)), -1)
     return out
 
 
+def apply_blur(img, leaf=None):
+    import cv2
+    return cv2.GaussianBlur(img, (15, 15), 0)
+
+
+Operations = {
+    "Gaussian Blur":   apply_blur,
+    "Mask":            apply_mask,
+    "ROI Objects":     apply_roi,
+    "Analyze Object":  apply_analyze,
+    "Pseudolandmarks": apply_landmarks
+}
+
+
+def select_ops(selection=None):
+    return {
+        key: func for key, func in Operations.items()
+        if not selection or selection.lower() in key.lower()
+    }
+
+
+def transform_one(img, ops, bgr=False):
+    """Renders every op for one image from a single LeafAnalysis."""
+    needs_leaf = any(func is not apply_blur for func in ops.values())
+    leaf = LeafAnalysis(img, bgr) if needs_leaf else None
+    return {key: func(img, leaf) for key, func in ops.items()}
+
+
 def transform(imgs, selection=None):
     """
     Applies transformations.
     If 'selection' is provided, only applies that specific transform.
     """
-    ops = {
-        "Gaussian Blur": lambda x: cv2.GaussianBlur(x, (15, 15), 0),
-        "Mask":            apply_mask,
-        "ROI Objects":     apply_roi,
-        "Analyze Object":  apply_analyze,
-        "Pseudolandmarks": apply_landmarks
-    }
+    ops = select_ops(selection)
     data = {"Original": imgs}
+    for key in ops:
+        data[key] = []
 
-    for key, func in ops.items():
-        if selection and selection.lower() not in key.lower():
-            continue
-        data[key] = [func(img) for img in imgs]
+    for img in imgs:
+        for key, out in transform_one(img, ops).items():
+            data[key].append(out)
 
     return data
@@ -0,0 +1,74 @@
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def encode_params(ext, quality=None, compression=None):
+    """cv2.imencode flags; None keeps cv2's default, as cv2.imwrite."""
+    import cv2
+    ext = ext.lower()
+    if ext in ('.jpg', '.jpeg') and quality is not None:
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if ext == '.webp' and quality is not None:
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    if ext == '.png' and compression is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    return []
+
+
+class OutputWriter:
+    """
+    Encodes and writes images on a thread pool so the transform stage
+    never blocks on disk. Images are written in the channel order given
+    (BGR, as decoded by cv2), so no conversion happens on the way out.
+    At most 'window' images wait in the pool; submit() blocks beyond it.
+    """
+
+    def __init__(self, workers=4, window=16, quality=None,
+                 compression=None):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(window)
+        self.quality = quality
+        self.compression = compression
+        self.errors = []
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def write(self, path, img):
+        import cv2
+        try:
+            params = encode_params(
+                os.path.splitext(path)[1], self.quality, self.compression
+            )
+            ok, buf = cv2.imencode(os.path.splitext(path)[1], img, params)
+            if not ok:
+                raise ValueError(f"could not encode '{path}'")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(buf)
+            with self.lock:
+                self.written += 1
+        except Exception as e:
+            with self.lock:
+                self.errors.append(e)
+        finally:
+            self.slots.release()
+
+    def submit(self, path, img):
+        self.slots.acquire()
+        self.pool.submit(self.write, path, img)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.pool.shutdown(wait=True)
@@ -1,48 +1,324 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import argparse
 import logging
 import json
-import cv2
+import csv
+import time
+import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from modules.config import on_key, CYAN, GREEN, RED, RESET
-from modules.config import IMG_HEIGHT, IMG_WIDTH, BATCH_SIZE
-from modules.transforms import apply_mask
+from modules.config import IMG_HEIGHT, IMG_WIDTH, BATCH_SIZE, IMAGE_EXTS
+from modules.augments import test_views, TestViews
+from modules.loader import imread
+from modules.preprocess import prepare_path, mask_bgr, finish, load_settings
+from modules.server import serve
+from modules.lite import LiteModel, LITE_MODEL, rss_mb
+from modules.split import is_split, load_split, listing
+from modules.shards import is_pack, ShardReader
+from modules.startup import profile_startup, FLAG
+from modules.evaluation import Evaluation, prefetched, print_report
+from modules.evaluation import write_report
+from modules.manifest import file_digest
+from modules.embeddings import EmbeddingIndex, write_embeddings
+from modules.embeddings import feature_model, EMBED_DIR
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 logging.getLogger('tensorflow').setLevel(logging.ERROR)
 
+# -decode reduced: JPEGs are decoded at the smallest 1/2, 1/4, 1/8 scale
+# covering this. Opt-in: the leaf mask's fixed 5x5 opening then runs on
+# fewer pixels than the full-size masks Transformation.py trains on.
+TARGET = (IMG_WIDTH, IMG_HEIGHT)
 
-def load_learnings():
-    assert os.path.exists("leaf_model.keras"), "Model not found!"
+
+def load_learnings(backend="keras", threads=None):
+    """Keras model (imports TensorFlow) or the exported TFLite one."""
     assert os.path.exists("classes.json"), "classes.json not found!"
+    if backend == "tflite":
+        model = LiteModel(LITE_MODEL, threads)
+    else:
+        assert os.path.exists("leaf_model.keras"), "Model not found!"
+        load_tensorflow()
+        model = tf.keras.models.load_model("leaf_model.keras")
 
-    model = tf.keras.models.load_model("leaf_model.keras")
     with open("classes.json", 'r') as f:
         class_names = json.load(f)
     return model, class_names
 
 
-def evaluate_directory(src, model, class_names):
-    assert os.path.isdir(src), "-src directory not valid"
+def labelled_paths(src, class_names):
+    """(path, label) of src/<class>/*, or of a split manifest's val files."""
+    if is_split(src):
+        split = load_split(src)
+        names, entries = listing(split, "val")
+        for name in names:
+            assert name in class_names, f"Unknown class '{name}'"
+        return [(os.path.join(split["root"], rel),
+                 class_names.index(names[label])) for rel, label in entries]
+
+    pairs = []
+    for cls in sorted(os.listdir(src)):
+        if not os.path.isdir(os.path.join(src, cls)):
+            continue
+        assert cls in class_names, f"Unknown class '{cls}'"
+        label = class_names.index(cls)
+        pairs += [(p, label) for p in list_images(os.path.join(src, cls))]
+    return pairs
+
+
+def load_pack(src, class_names, target=None, mask=False):
+    """Val records (all when unsplit) of a Pack.py pack."""
+    reader = ShardReader(src, mask)
+    for name in reader.classes:
+        assert name in class_names, f"Unknown class '{name}'"
+    imgs, labels = [], []
+    for i in reader.select("val"):
+        img = reader.image(i, target)
+        if img is None:
+            continue
+        imgs.append(img)
+        labels.append(class_names.index(reader.classes[reader.labels[i]]))
+    assert imgs, f"No images found in '{src}'"
+    return np.stack(imgs), np.array(labels)
+
+
+def load_directory(src, class_names, target=None, mask=False):
+    """
+    uint8 (N, H, W, 3) images and labels of -src through the shared
+    preprocessing graph, so every backend sees the pixels train saw.
+    """
+    if is_pack(src):
+        return load_pack(src, class_names, target, mask)
+    imgs, labels = [], []
+    for path, label in labelled_paths(src, class_names):
+        img = prepare_path(path, mask, target)
+        if img is None:
+            continue
+        imgs.append(img)
+        labels.append(label)
+    assert imgs, f"No images found in '{src}'"
+    return np.stack(imgs), np.array(labels)
+
+
+def predict_probs(model, batch, tta=1):
+    """
+    Class probabilities of an image batch. With tta > 1, the tta views
+    of every image go through a single model.predict batch and the
+    probabilities are averaged per image.
+    """
+    if tta <= 1:
+        return model.predict(np.asarray(batch, np.float32), verbose=0)
+    views = test_views(np.asarray(batch), tta).astype(np.float32)
+    probs = model.predict(views, batch_size=len(views), verbose=0)
+    return probs.reshape(tta, len(batch), -1).mean(axis=0)
+
+
+def run_batches(model, imgs, tta=1):
+    """Predicted labels plus per-batch latencies (ms)."""
+    preds, lat = [], []
+    for i in range(0, len(imgs), BATCH_SIZE):
+        batch = imgs[i:i + BATCH_SIZE]
+        t = time.perf_counter()
+        out = predict_probs(model, batch, tta)
+        lat.append((time.perf_counter() - t) * 1000)
+        preds.append(np.argmax(out, axis=1))
+    return np.concatenate(preds), lat
+
+
+def compare_backends(src, class_names, threads=None, mask=False):
+    """
+    Scores -src with the TFLite model, then the Keras one, and reports
+    accuracy, latency and the RSS each backend added on load and use.
+    TFLite runs first so its numbers never include TensorFlow.
+    """
+    assert os.path.exists(src), "-src not valid"
+    imgs, labels = load_directory(src, class_names, mask=mask)
+    results = {}
+    preds = {}
+    for backend in ("tflite", "keras"):
+        before = rss_mb()
+        model, _ = load_learnings(backend, threads)
+        loaded = rss_mb()
+        run_batches(model, imgs[:BATCH_SIZE])
+        t = time.perf_counter()
+        preds[backend], lat = run_batches(model, imgs)
+        total = time.perf_counter() - t
+        results[backend] = {
+            "accuracy": float(np.mean(preds[backend] == labels)),
+            "p50_ms": float(np.percentile(lat, 50)),
+            "p99_ms": float(np.percentile(lat, 99)),
+            "images_per_s": len(imgs) / total,
+            "load_mb": loaded - before,
+            "rss_mb": rss_mb()
+        }
+
+    print(CYAN + f"\n{'BACKEND':<10}{'accuracy':>10}{'p50 ms':>9}"
+          f"{'p99 ms':>9}{'img/s':>9}{'load MB':>9}{'RSS MB':>9}" + RESET)
+    for backend, r in results.items():
+        print(f"{backend:<10}{r['accuracy'] * 100:>9.2f}%{r['p50_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['images_per_s']:>9.1f}"
+              f"{r['load_mb']:>9.0f}{r['rss_mb']:>9.0f}")
+    delta = results["tflite"]["accuracy"] - results["keras"]["accuracy"]
+    agree = np.mean(preds["tflite"] == preds["keras"])
+    print(f"\nAccuracy delta (tflite - keras): {GREEN}"
+          f"{delta * 100:+.2f}%{RESET}, agreement {agree * 100:.2f}% "
+          f"over {len(imgs)} images")
+    return results
+
+
+def compare_decoding(src, model, class_names, tta=1, mask=False):
+    """Accuracy and decode time of -src at full size versus reduced."""
+    assert os.path.exists(src), "-src not valid"
+    results = {}
+    for name, target in (("full", None), ("reduced", TARGET)):
+        t = time.perf_counter()
+        imgs, labels = load_directory(src, class_names, target, mask)
+        decode = (time.perf_counter() - t) / len(imgs) * 1000
+        preds, _ = run_batches(model, imgs, tta)
+        results[name] = (preds, np.mean(preds == labels), decode)
+
+    print(CYAN + f"\n{'DECODE':<10}{'accuracy':>10}{'ms/image':>10}" + RESET)
+    for name, (_, acc, decode) in results.items():
+        print(f"{name:<10}{acc * 100:>9.2f}%{decode:>10.2f}")
+    full, reduced = results["full"], results["reduced"]
+    print(f"\nAccuracy delta (reduced - full): {GREEN}"
+          f"{(reduced[1] - full[1]) * 100:+.2f}%{RESET}, agreement "
+          f"{np.mean(full[0] == reduced[0]) * 100:.2f}%, decode "
+          f"{full[2] / reduced[2]:.1f}x faster over {len(labels)} images")
+
+
+def eval_source(src, class_names, target=None, mask=False):
+    """
+    (items, names, labels, load) of -src: file paths with prepare_path,
+    or the val records of a pack with ShardReader.image, named by their
+    path inside the pack. load(item) gives the uint8 model input, None
+    when unreadable.
+    """
+    if is_pack(src):
+        reader = ShardReader(src, mask)
+        for name in reader.classes:
+            assert name in class_names, f"Unknown class '{name}'"
+        rows = reader.select("val")
+        labels = [class_names.index(reader.classes[label])
+                  for label in reader.labels[rows]]
+        names = [os.path.join(src, reader.names[i]) for i in rows]
+        return rows.tolist(), names, labels, \
+            lambda i: reader.image(i, target)
+    pairs = labelled_paths(src, class_names)
+    paths = [p for p, _ in pairs]
+    return paths, paths, [label for _, label in pairs], \
+        lambda path: prepare_path(path, mask, target)
+
+
+def evaluate_directory(src, model, class_names, tta=1, target=None,
+                       mask=False, workers=4, report=None, model_file=None):
+    """
+    Streams -src in BATCH_SIZE shards: 'workers' threads decode the
+    next shard while the model scores the current one, and confusion
+    counts are aggregated per batch. Prints per-class precision, recall
+    and F1 plus the most confused pairs; 'report' (.json) keeps them
+    with images/s and wall time to compare model versions.
+    """
+    assert os.path.exists(src), "-src not valid"
 
     print(CYAN + "\nEXTRACTING IMAGES:" + RESET)
-    ds = tf.keras.utils.image_dataset_from_directory(
-        src,
-        image_size=(IMG_HEIGHT, IMG_WIDTH),
-        batch_size=BATCH_SIZE,
-        shuffle=False
-    )
+    items, _, labels, load = eval_source(src, class_names, target, mask)
+    assert items, f"No images found in '{src}'"
+    print(f"Found {len(items)} images belonging to "
+          f"{len(set(labels))} classes.")
 
     print(CYAN + "\nEVALUATING MODEL:" + RESET)
-    loss, acc = model.evaluate(ds, verbose=1)
-    print(f"\n'{src}':\t Accuracy = {GREEN}[{acc*100:.2f}%]", end="")
-    print(f"\t{RESET} Loss = {RED}[{loss:.4f}]{RESET}")
+    result = Evaluation(class_names)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk, arrays in prefetched(zip(items, labels),
+                                        lambda it: load(it[0]), pool):
+            ok = [(a, label) for a, (_, label) in zip(arrays, chunk)
+                  if a is not None]
+            result.skipped += len(chunk) - len(ok)
+            if not ok:
+                continue
+            probs = predict_probs(model, np.stack([a for a, _ in ok]), tta)
+            result.add(probs, [label for _, label in ok])
+            print(f"\rScored {result.count} images", end="", flush=True)
+    print()
+
+    out = result.finish().report(
+        src=src, model=model_file,
+        model_sha1=file_digest(model_file) if model_file else None,
+        tta=tta, workers=workers, batch_size=BATCH_SIZE,
+        decode="reduced" if target else "full", mask=bool(mask)
+    )
+    print_report(out, src)
+    if report:
+        write_report(out, report)
+        print(f"Report saved to '{report}'.")
+    return out
+
+
+def embed_directory(src, model, class_names, out=EMBED_DIR, target=None,
+                    mask=False, workers=4):
+    """
+    Penultimate Dense activations of every -src image (val records of a
+    split or pack) into a float16 memmap plus path index under 'out'.
+    """
+    assert os.path.exists(src), "-src not valid"
+    items, names, labels, load = eval_source(src, class_names, target,
+                                             mask)
+    assert items, f"No images found in '{src}'"
+
+    print(CYAN + "\nEMBEDDING IMAGES:" + RESET)
+    features = feature_model(model, tf)
+    t = time.perf_counter()
+    count = write_embeddings(
+        out, items, names, labels, load,
+        lambda batch: features.predict(
+            batch.astype(np.float32), batch_size=len(batch), verbose=0
+        ),
+        features.output_shape[-1], workers,
+        {"src": src, "classes": class_names, "decode":
+         "reduced" if target else "full", "mask": bool(mask)}
+    )
+    elapsed = time.perf_counter() - t
+    print(GREEN + f"{count} embeddings saved to '{out}' in {elapsed:.2f}s "
+          f"({count / elapsed:.1f} images/s)" + RESET)
+
+
+def nearest_images(img_paths, model, k=5, path=EMBED_DIR, target=None,
+                   mask=False):
+    """
+    Prints the k nearest indexed images of every query image. Queries
+    are masked like any single image, so the index must have been built
+    with the same -decode and mask settings to be comparable.
+    """
+    index = EmbeddingIndex(path)
+    decode = "reduced" if target else "full"
+    assert index.meta.get("decode") == decode, \
+        f"'{path}' was embedded with -decode {index.meta.get('decode')}"
+    assert index.meta.get("mask") == bool(mask), \
+        f"'{path}' was embedded with other mask settings: re-run --embed"
+    class_names = index.meta["classes"]
+    features = feature_model(model, tf)
+    for img_path in img_paths:
+        img = prepare_path(img_path, True, target)
+        if img is None:
+            print(RED + f"Error: could not read '{img_path}'" + RESET)
+            continue
+        vector = features.predict(img[None].astype(np.float32), verbose=0)
+        t = time.perf_counter()
+        idx, sim = index.query(vector, k)
+        ms = (time.perf_counter() - t) * 1000
+        print(CYAN + f"\n{img_path}" + RESET +
+              f" ({len(index)} indexed, {ms:.2f} ms):")
+        for i, s in zip(idx[0], sim[0]):
+            print(f"  {s:.4f}  {class_names[index.labels[i]]:<20} "
+                  f"{index.paths[i]}")
 
 
 def vis_predictions(imgs_rgb, imgs_masked, filenames, pred, conf):
+    import matplotlib.pyplot as plt
     count = len(imgs_rgb)
     if count == 0:
         return
@@ -76,7 +352,8 @@ def vis_predictions(imgs_rgb, imgs_masked, filenames, pred, conf):
     plt.show()
 
 
-def predict_images(img_paths, model, class_names):
+def predict_images(img_paths, model, class_names, tta=1, target=None):
+    import cv2
     imgs_rgb = []
     imgs_masked = []
     filenames = []
@@ -85,22 +362,18 @@ def predict_images(img_paths, model, class_names):
     for path in img_paths:
         assert os.path.isfile(path), "Improper Arguments Passed!"
 
-        img = cv2.imread(path)
+        img = imread(path, target)
         if img is not None:
-            rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            masked = apply_mask(rgb)
-            resized = cv2.resize(masked, (IMG_WIDTH, IMG_HEIGHT))
-
-            imgs_rgb.append(rgb)
-            imgs_masked.append(masked)
+            masked = mask_bgr(img)
+            imgs_rgb.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+            imgs_masked.append(cv2.cvtColor(masked, cv2.COLOR_BGR2RGB))
             filenames.append(os.path.basename(path))
-            arrays.append(resized)
+            arrays.append(finish(masked))
 
     if not arrays:
         raise ValueError("No images found.")
 
-    batch = np.array(arrays, dtype=np.float32)
-    preds = model.predict(batch, verbose=0)
+    preds = predict_probs(model, np.array(arrays), tta)
 
     predictions = []
     confidences = []
@@ -112,24 +385,191 @@ def predict_images(img_paths, model, class_names):
     vis_predictions(imgs_rgb, imgs_masked, filenames, predictions, confidences)
 
 
+def list_images(src):
+    for root, _, files in os.walk(src):
+        for f in sorted(files):
+            if f.lower().endswith(IMAGE_EXTS):
+                yield os.path.join(root, f)
+
+
+def batch_predict(img_paths, model, class_names, out, top_k=3, workers=4,
+                  tta=1, target=None):
+    """
+    Headless scoring: chunks of BATCH_SIZE are decoded/masked/resized in
+    a thread pool while the previous chunk runs through model.predict,
+    and top-k rows are streamed to 'out' (.jsonl or .csv) as they land.
+    Missing or unreadable inputs get a row with their 'error' instead,
+    and are counted. Only two chunks are ever held in memory.
+    """
+    top_k = min(top_k, len(class_names))
+    as_csv = out.lower().endswith(".csv")
+    count = skipped = 0
+    with open(out, 'w', newline='') as f, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        writer = csv.writer(f) if as_csv else None
+        if writer:
+            header = ["path"]
+            for k in range(1, top_k + 1):
+                header += [f"class_{k}", f"confidence_{k}"]
+            writer.writerow(header + ["error"])
+
+        for chunk, loaded in prefetched(
+                img_paths, lambda p: prepare_path(p, True, target), pool):
+            arrays = [(p, a) for p, a in zip(chunk, loaded) if a is not None]
+            for path, a in zip(chunk, loaded):
+                if a is not None:
+                    continue
+                error = "unreadable" if os.path.isfile(path) else "missing"
+                if writer:
+                    writer.writerow([path] + [""] * (2 * top_k) + [error])
+                else:
+                    f.write(json.dumps({"path": path, "error": error}) + "\n")
+            skipped += len(chunk) - len(arrays)
+            if not arrays:
+                continue
+            preds = predict_probs(
+                model, np.stack([a for _, a in arrays]), tta
+            )
+
+            for (path, _), p in zip(arrays, preds):
+                top = np.argsort(p)[::-1][:top_k]
+                if writer:
+                    row = [path]
+                    for idx in top:
+                        row += [class_names[idx], f"{p[idx] * 100:.2f}"]
+                    writer.writerow(row + [""])
+                else:
+                    f.write(json.dumps({"path": path, "top": [
+                        {"class": class_names[idx],
+                         "confidence": round(float(p[idx] * 100), 2)}
+                        for idx in top
+                    ]}) + "\n")
+            f.flush()
+            count += len(arrays)
+            print(f"\rScored {count} images", end="", flush=True)
+    print(f"\nResults written to '{out}'.")
+    if skipped:
+        print(f"{skipped} missing or unreadable images skipped "
+              f"(see their 'error' rows).")
+
+
+def source_mask():
+    """
+    Whether -src images get masked. Single images are always masked; a
+    -src directory only when the model was trained with train.py --mask,
+    otherwise it is expected to be masked offline by Transformation.py.
+    """
+    return bool(load_settings().get("mask"))
+
+
+def load_tensorflow():
+    """TensorFlow is only imported when the Keras backend is used."""
+    global tf
+    import tensorflow as tf
+
+
 def main():
     parser = argparse.ArgumentParser(description="Predict leaf disease.")
     parser.add_argument('imgs', nargs='*', help='Image files to predict')
-    parser.add_argument('-src', help='Directory for accuracy evaluation')
+    parser.add_argument('-src',
+                        help='Directory, split .json or pack (val) to '
+                        'evaluate')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep the model warm behind an HTTP server')
+    parser.add_argument('-host', default='127.0.0.1', help='--serve host')
+    parser.add_argument('-port', type=int, default=8000, help='--serve port')
+    parser.add_argument('-wait', type=float, default=5.0,
+                        help='--serve max micro-batch wait (ms)')
+    parser.add_argument('--batch-out',
+                        help='Headless scoring to results.jsonl or .csv')
+    parser.add_argument('-topk', type=int, default=3,
+                        help='Classes per row for --batch-out')
+    parser.add_argument('--embed', action='store_true',
+                        help='Save -src penultimate embeddings to -index')
+    parser.add_argument('-knn', type=int, metavar='K',
+                        help='K nearest -index images of each image')
+    parser.add_argument('-index', default=EMBED_DIR,
+                        help='Embedding index directory')
+    parser.add_argument('-workers', type=int, default=4,
+                        help='Decode threads for -src and --batch-out')
+    parser.add_argument('-report',
+                        help='-src evaluation report (metrics, speed) .json')
+    parser.add_argument('--tta', type=int, default=1, metavar='K',
+                        help=f'Average K test-time views (1-{len(TestViews)})')
+    parser.add_argument('-decode', choices=['reduced', 'full'],
+                        default='full',
+                        help='JPEG decode scale (reduced: opt-in 1/2-1/8)')
+    parser.add_argument('--compare-decode', action='store_true',
+                        help='Accuracy and speed of both -decode on -src')
+    parser.add_argument('-backend', choices=['keras', 'tflite'],
+                        default='keras',
+                        help=f"Inference engine (tflite: '{LITE_MODEL}')")
+    parser.add_argument('-threads', type=int,
+                        help='TFLite interpreter threads (default: all)')
+    parser.add_argument('--compare', action='store_true',
+                        help='Accuracy, latency, memory of both on -src')
+    parser.add_argument(FLAG, action='store_true',
+                        help='Print the slowest imports of this run')
     args = parser.parse_args()
 
-    assert bool(args.imgs) != bool(args.src), "Images OR -src directory!"
-
-    model, class_names = load_learnings()
+    assert args.workers > 0, "-workers must be positive"
+    assert 1 <= args.tta <= len(TestViews), \
+        f"--tta must be 1-{len(TestViews)}"
+    if args.serve:
+        assert not args.imgs and not args.src, "--serve takes no inputs"
+    else:
+        assert bool(args.imgs) != bool(args.src), "Images OR -src directory!"
+
+    if args.compare:
+        assert args.src, "--compare needs -src"
+        assert os.path.exists("classes.json"), "classes.json not found!"
+        with open("classes.json", 'r') as f:
+            compare_backends(args.src, json.load(f), args.threads,
+                             source_mask())
+        return
 
-    if args.src:
-        evaluate_directory(args.src, model, class_names)
+    knn = args.knn is not None
+    if args.embed or knn:
+        assert args.backend == 'keras', "Embeddings need -backend keras"
+        assert not args.embed or args.src, "--embed needs -src"
+        assert not knn or args.imgs, "-knn needs query images"
+        assert not knn or args.knn > 0, "-knn must be positive"
+    model, class_names = load_learnings(args.backend, args.threads)
+    target = TARGET if args.decode == 'reduced' else None
+    src_mask = source_mask()
+
+    if args.compare_decode:
+        assert args.src, "--compare-decode needs -src"
+        compare_decoding(args.src, model, class_names, args.tta, src_mask)
+    elif args.embed:
+        embed_directory(args.src, model, class_names, args.index, target,
+                        src_mask, args.workers)
+    elif knn:
+        nearest_images(args.imgs, model, args.knn, args.index, target,
+                       src_mask)
+    elif args.serve:
+        serve(model, class_names, args.host, args.port, args.wait, target)
+    elif args.batch_out:
+        assert not (args.src and is_pack(args.src)), \
+            "--batch-out reads image files: pass a directory, not a pack"
+        if args.src and is_split(args.src):
+            paths = (p for p, _ in labelled_paths(args.src, class_names))
+        else:
+            paths = list_images(args.src) if args.src else iter(args.imgs)
+        batch_predict(paths, model, class_names, args.batch_out, args.topk,
+                      args.workers, args.tta, target)
+    elif args.src:
+        model_file = LITE_MODEL if args.backend == 'tflite' \
+            else "leaf_model.keras"
+        evaluate_directory(args.src, model, class_names, args.tta, target,
+                           src_mask, args.workers, args.report, model_file)
     else:
-        predict_images(args.imgs, model, class_names)
+        predict_images(args.imgs, model, class_names, args.tta, target)
 
 
 if __name__ == "__main__":
-    import tensorflow as tf
+    if FLAG in sys.argv:
+        exit(profile_startup())
     try:
         main()
     except Exception as e:
@@ -1,48 +1,240 @@
+import numpy as np
 import argparse
 import logging
 import json
+import sys
 import os
 
 from modules.config import CYAN, GREEN, RED, RESET
 from modules.config import IMG_HEIGHT, IMG_WIDTH, BATCH_SIZE, EPOCHS
+from modules.cache import build_cache, scan
+from modules.augments import AvailableTransforms
+from modules.startup import profile_startup, FLAG
+from modules.lite import export_tflite, LITE_MODEL
+from modules.split import is_split, load_split, listing
+from modules.profiles import PROFILES, load_profile, apply_env, apply_tf
+from modules.profiles import describe, epoch_timer, SampleCounter
+from modules.preprocess import tf_images, save_settings, load_settings
+from modules.preprocess import prepare_path, SETTINGS
+from modules.shards import is_pack, read_meta, ShardReader
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 logging.getLogger('tensorflow').setLevel(logging.ERROR)
 
 
-def getData(dir):
-    """Extracts the dataset efficiently from the passed directory."""
+def cached_dataset(images, labels, shuffle, rows=None):
+    """
+    Batches straight out of the memmap (or a ShardReader): no JPEG
+    decode, no resize. 'rows' maps sample i to images[rows[i]].
+    """
+    def gather(idx):
+        idx = np.sort(idx)
+        return images[idx if rows is None else rows[idx]] \
+            .astype(np.float32), labels[idx]
+
+    def load(idx):
+        x, y = tf.numpy_function(gather, [idx], (tf.float32, tf.int32))
+        x.set_shape((None, IMG_HEIGHT, IMG_WIDTH, 3))
+        y.set_shape((None,))
+        return x, y
+
+    ds = tf.data.Dataset.range(len(labels))
+    if shuffle:
+        ds = ds.shuffle(len(labels), seed=123, reshuffle_each_iteration=True)
+    ds = ds.batch(BATCH_SIZE).map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(buffer_size=tf.data.AUTOTUNE)
+
+
+def getCachedData(train_dir, val_dir, cache_dir, split=None, mask=False,
+                  train=True):
+    """Cached train/val datasets; without 'train' only val is built."""
+    train_list = val_list = None
+    if split:
+        train_list, val_list = listing(split, "train"), listing(split, "val")
+    val_x, val_y, class_names = \
+        build_cache(val_dir, cache_dir, val_list, "val", mask)
+    val_ds = cached_dataset(val_x, val_y, shuffle=False)
+    train_ds = None
+    if train:
+        train_x, train_y, train_names = \
+            build_cache(train_dir, cache_dir, train_list, "train", mask)
+        assert train_names == class_names, "Mismatched classes"
+        train_ds = cached_dataset(train_x, train_y, shuffle=True)
+    return train_ds, val_ds, class_names
+
+
+def getPackData(path, mask=False):
+    """Train/val records of a Pack.py pack, read from its mapped shards."""
+    reader = ShardReader(path, mask)
+    train_rows, val_rows = reader.select("train"), reader.select("val")
+    assert len(train_rows) and len(val_rows), \
+        f"'{path}' needs a train/val split: pack a split .json or train/ dir"
+    train_ds = cached_dataset(reader, reader.labels[train_rows], True,
+                              train_rows)
+    val_ds = cached_dataset(reader, reader.labels[val_rows], False,
+                            val_rows)
+    return train_ds, val_ds, reader.classes
+
+
+def augment_sample(img, label):
+    """
+    Draws one of AvailableTransforms (or none) per sample, per epoch.
+    The cv2 kernels release the GIL, so parallel map calls scale.
+    """
+    choice = tf.random.uniform((), 0, len(AvailableTransforms) + 1, tf.int32)
+
+    def run(x, i):
+        if i == 0:
+            return x
+        return AvailableTransforms[i - 1][0](x)
+
+    out = tf.numpy_function(run, [img, choice], tf.uint8)
+    out.set_shape((IMG_HEIGHT, IMG_WIDTH, 3))
+    return tf.cast(out, tf.float32), label
+
+
+def augmentedData(train_dir, train_list=None, mask=False, cache_dir=None):
+    """
+    Balanced, augmented training stream with no files written: every
+    class is sampled with equal weight, and one epoch covers
+    num_classes * largest_class samples. Images are decoded once, into
+    the -cache memmap or into memory during the first epoch; only
+    sampling and augment_sample run every epoch.
+    """
+    if cache_dir:
+        images, labels, class_names = build_cache(
+            train_dir, cache_dir, train_list, "train", mask
+        )
+    else:
+        class_names, entries = train_list or scan(train_dir)
+
+    def gather(i, label):
+        x = tf.numpy_function(lambda i: images[i], [i], tf.uint8)
+        x.set_shape((IMG_HEIGHT, IMG_WIDTH, 3))
+        return x, label
+
+    streams = []
+    largest = 0
+    for label in range(len(class_names)):
+        if cache_dir:
+            rows = np.flatnonzero(labels == label)
+            count = len(rows)
+            ds = tf.data.Dataset.from_tensor_slices((rows, labels[rows]))
+        else:
+            paths = [os.path.join(train_dir, rel)
+                     for rel, lbl in entries if lbl == label]
+            count = len(paths)
+            ds = tf_images(tf, tf.data.Dataset.from_tensor_slices(
+                (paths, [label] * count)
+            ), mask).cache()
+        assert count, f"No images for class '{class_names[label]}'"
+        largest = max(largest, count)
+        streams.append(ds.shuffle(count).repeat())
+
+    AUTOTUNE = tf.data.AUTOTUNE
+    weights = [1 / len(streams)] * len(streams)
+    ds = tf.data.Dataset.sample_from_datasets(streams, weights)
+    ds = ds.take(largest * len(streams))
+    if cache_dir:
+        ds = ds.map(gather, num_parallel_calls=AUTOTUNE)
+    ds = ds.map(augment_sample, num_parallel_calls=AUTOTUNE)
+    return ds.batch(BATCH_SIZE).prefetch(buffer_size=AUTOTUNE), class_names
+
+
+def listedDataset(root, train_list, shuffle, mask=False):
+    """
+    (rel, label) entries of a scanned directory or a split manifest
+    through the shared preprocessing graph, batched and cached.
+    """
+    _, entries = train_list
+    paths = [os.path.join(root, rel) for rel, _ in entries]
+    labels = [label for _, label in entries]
+    assert paths, f"Empty split in '{root}'"
+    AUTOTUNE = tf.data.AUTOTUNE
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if shuffle:
+        ds = ds.shuffle(len(paths), seed=123, reshuffle_each_iteration=False)
+    ds = tf_images(tf, ds, mask)
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32), y))
+    ds = ds.batch(BATCH_SIZE).cache()
+    if shuffle:
+        ds = ds.shuffle(1000)
+    return ds.prefetch(buffer_size=AUTOTUNE)
+
+
+def getSplitData(split, mask=False, train=True):
+    root = split["root"]
+    train_ds = listedDataset(root, listing(split, "train"), True, mask) \
+        if train else None
+    val_ds = listedDataset(root, listing(split, "val"), False, mask)
+    return train_ds, val_ds, split["classes"]
+
+
+def getDirectoryData(train_dir, val_dir, mask=False, train=True):
+    train_list, val_list = scan(train_dir), scan(val_dir)
+    assert train_list[0] == val_list[0], "Mismatched classes"
+    print(f"Found {len(train_list[1])} train and {len(val_list[1])} val "
+          f"files belonging to {len(train_list[0])} classes.")
+    train_ds = listedDataset(train_dir, train_list, True, mask) \
+        if train else None
+    val_ds = listedDataset(val_dir, val_list, False, mask)
+    return train_ds, val_ds, train_list[0]
+
+
+def getData(dir, cache_dir=None, augment=False, mask=False):
+    """
+    Extracts the dataset efficiently from the passed directory, or from
+    the files of a split manifest (Augmentation.py -split) in place, or
+    from a Pack.py pack. 'mask' segments leaves on the fly, so no masked
+    copy is needed. With 'augment' the static train set is never built:
+    augmentedData samples the decoded train images (the -cache memmap
+    when given) and only val comes from the cache or listing.
+    """
     assert os.path.exists(dir), f"Cannot find '{dir}"
+    if is_pack(dir):
+        assert not cache_dir, "A pack is already preprocessed: drop -cache"
+        assert not augment, "--augment needs source files, not a pack"
+        return getPackData(dir, mask)
+    if is_split(dir):
+        split = load_split(dir)
+        root = split["root"]
+        if cache_dir:
+            train_ds, val_ds, class_names = getCachedData(
+                root, root, cache_dir, split, mask, not augment
+            )
+        else:
+            train_ds, val_ds, class_names = \
+                getSplitData(split, mask, not augment)
+        if augment:
+            train_ds, _ = augmentedData(root, listing(split, "train"), mask,
+                                        cache_dir)
+        return train_ds, val_ds, class_names
+
     train_dir = os.path.join(dir, 'train')
     val_dir = os.path.join(dir, 'val')
 
     assert os.path.exists(train_dir), f"Cannot find '{train_dir}'"
     assert os.path.exists(val_dir), f"Cannot find '{val_dir}'"
-    train_ds = tf.keras.utils.image_dataset_from_directory(
-        train_dir,
-        seed=123,
-        image_size=(IMG_HEIGHT, IMG_WIDTH),
-        batch_size=BATCH_SIZE
-    )
-    val_ds = tf.keras.utils.image_dataset_from_directory(
-        val_dir,
-        seed=123,
-        image_size=(IMG_HEIGHT, IMG_WIDTH),
-        batch_size=BATCH_SIZE
-    )
-
-    class_names = train_ds.class_names
-    assert class_names == val_ds.class_names, "Mismatched classes"
-    AUTOTUNE = tf.data.AUTOTUNE
-    train_ds = train_ds.cache().shuffle(1000).prefetch(buffer_size=AUTOTUNE)
-    val_ds = val_ds.cache().prefetch(buffer_size=AUTOTUNE)
+    if cache_dir:
+        train_ds, val_ds, class_names = getCachedData(
+            train_dir, val_dir, cache_dir, mask=mask, train=not augment
+        )
+    else:
+        train_ds, val_ds, class_names = \
+            getDirectoryData(train_dir, val_dir, mask, not augment)
 
+    if augment:
+        train_ds, aug_names = augmentedData(train_dir, mask=mask,
+                                            cache_dir=cache_dir)
+        assert aug_names == class_names, "Mismatched classes"
     return train_ds, val_ds, class_names
 
 
-def create_model(num_classes):
-    """Builds the Convolutional Neural Network."""
+def create_model(num_classes, jit_compile=False):
+    """
+    Builds the Convolutional Neural Network. The softmax stays float32
+    under a mixed-precision policy.
+    """
     model = models.Sequential([
         layers.Input(shape=(IMG_HEIGHT, IMG_WIDTH, 3)),
 
@@ -60,33 +252,155 @@ def create_model(num_classes):
         layers.Flatten(),
         layers.Dense(256, activation='relu'),
         layers.Dropout(0.5),
-        layers.Dense(num_classes, activation='softmax')
+        layers.Dense(num_classes, activation='softmax', dtype='float32')
     ])
 
     model.compile(optimizer='adam',
                   loss='sparse_categorical_crossentropy',
-                  metrics=['accuracy'])
+                  metrics=['accuracy'],
+                  jit_compile=jit_compile)
     return model
 
 
-def save_learnings(model, class_names):
-    """Saves the trained model and class labels locally."""
+def save_learnings(model, class_names, mask=False):
+    """Saves the trained model, class labels and preprocessing locally."""
     model.save("leaf_model.keras")
 
     with open("classes.json", 'w') as f:
         json.dump(class_names, f)
+    save_settings(mask)
+
+    print(f"Successfully saved 'leaf_model.keras', 'classes.json' "
+          f"and '{SETTINGS}'")
+
+
+def calibration_batches(val_ds, count):
+    """Up to 'count' validation images, batch by batch, for int8."""
+    seen = 0
+    for x, _ in val_ds:
+        if seen >= count:
+            return
+        batch = x.numpy()[:count - seen]
+        seen += len(batch)
+        yield batch
 
-    print("Successfully saved 'leaf_model.keras' and 'classes.json'")
+
+def calibration_sample(dir, count, mask=False):
+    """
+    Up to 'count' val images spread evenly over the val listing, read
+    straight from the source (no dataset, no cache), in float32 batches.
+    """
+    if is_pack(dir):
+        reader = ShardReader(dir, mask)
+        rows = reader.select("val")
+        pick = np.linspace(0, len(rows) - 1, min(count, len(rows)))
+        imgs = reader[rows[pick.astype(int)]]
+    else:
+        if is_split(dir):
+            split = load_split(dir)
+            root = split["root"]
+            _, entries = listing(split, "val")
+        else:
+            root = os.path.join(dir, 'val')
+            _, entries = scan(root)
+        pick = np.linspace(0, len(entries) - 1, min(count, len(entries)))
+        imgs = [prepare_path(os.path.join(root, entries[i][0]), mask)
+                for i in pick.astype(int)]
+        imgs = np.stack([img for img in imgs if img is not None])
+    return [imgs[i:i + BATCH_SIZE].astype(np.float32)
+            for i in range(0, len(imgs), BATCH_SIZE)]
+
+
+def export_learnings(model, val_ds=None, calibrate=0, calibration=None):
+    """
+    Writes the TFLite model, int8-quantized when calibrate > 0 (on the
+    first val_ds images) or when 'calibration' batches are given.
+    """
+    if calibrate and calibration is None:
+        calibration = list(calibration_batches(val_ds, calibrate))
+    size = export_tflite(model, LITE_MODEL, calibration)
+    kind = "int8" if calibration else "float32"
+    print(f"Successfully exported '{LITE_MODEL}' "
+          f"({kind}, {size / 2**20:.2f} MB)")
+
+
+def load_tensorflow():
+    """TensorFlow is only imported once the arguments are valid."""
+    global tf, models, layers, callbacks
+    import tensorflow as tf
+    from keras import models, layers, callbacks
 
 
 def main():
     parser = argparse.ArgumentParser(description="Train Model on Dataset")
-    parser.add_argument('dir', help='Dataset directory for train and val')
+    parser.add_argument('dir',
+                        help='train/ + val/ directory, split .json or pack')
+    parser.add_argument('-cache', help='Persistent preprocessed-tensor cache')
+    parser.add_argument('--augment', action='store_true',
+                        help='Balance and augment train on the fly')
+    parser.add_argument('--mask', action='store_true',
+                        help='Mask leaves on the fly (unmasked dataset)')
+    parser.add_argument('--export', action='store_true',
+                        help=f"Also write '{LITE_MODEL}' for predict.py")
+    parser.add_argument('--export-only', action='store_true',
+                        help="Export the saved model without training")
+    parser.add_argument('-int8', type=int, default=0, metavar='N',
+                        help='Quantize to int8, calibrated on N val images')
+    parser.add_argument('-profile', default='default',
+                        help=f"{' | '.join(PROFILES)} or a .json file")
+    parser.add_argument('--onednn', action='store_true', default=None,
+                        help='Enable oneDNN CPU kernels')
+    parser.add_argument('-threads', type=int, help='Intra-op threads')
+    parser.add_argument('-inter', type=int, help='Inter-op threads')
+    parser.add_argument('--bf16', action='store_const', const='bfloat16',
+                        help='bfloat16 mixed precision (if the CPU has it)')
+    parser.add_argument('--xla', action='store_true', default=None,
+                        help='XLA JIT compilation')
+    parser.add_argument('-epochs', type=int, default=EPOCHS,
+                        help='Maximum epochs')
+    parser.add_argument('-timings',
+                        help='Append per-epoch timings (JSONL) here')
+    parser.add_argument('-trace', help='TensorBoard profiler log dir')
+    parser.add_argument('-trace-steps', default='10,20',
+                        help='Global step range [start,stop) for -trace')
+    parser.add_argument(FLAG, action='store_true',
+                        help='Print the slowest imports of this run')
     args = parser.parse_args()
 
+    trace_steps = tuple(int(s) for s in args.trace_steps.split(','))
+    assert len(trace_steps) == 2 and trace_steps[0] < trace_steps[1], \
+        "-trace-steps must be start,stop"
+    profile = load_profile(
+        args.profile, onednn=args.onednn, threads=args.threads,
+        inter_threads=args.inter, precision=args.bf16, xla=args.xla
+    )
+    apply_env(profile)
+    load_tensorflow()
+    apply_tf(profile, tf)
+    print(CYAN + "\n" + describe(profile) + RESET)
+
+    if args.export_only:
+        assert os.path.exists("leaf_model.keras"), "Model not found!"
+        calibration = None
+        if args.int8:
+            print(CYAN + "\nLOADING CALIBRATION IMAGES:" + RESET)
+            calibration = calibration_sample(
+                args.dir, args.int8,
+                args.mask or bool(load_settings().get("mask"))
+            )
+        print(CYAN + "\nEXPORTING MODEL:" + RESET)
+        model = tf.keras.models.load_model("leaf_model.keras")
+        export_learnings(model, calibration=calibration)
+        return
+
     print(CYAN + "\nEXTRACTING DATA:" + RESET)
-    train_ds, val_ds, class_names = getData(args.dir)
-    model = create_model(len(class_names))
+    train_ds, val_ds, class_names = \
+        getData(args.dir, args.cache, args.augment, args.mask)
+    model = create_model(len(class_names), jit_compile=profile["xla"])
+    counter = SampleCounter(tf)
+    timer = epoch_timer(callbacks, profile, counter, args.timings, train_ds,
+                        tf, args.trace, trace_steps)
+    train_ds = counter.wrap(train_ds, tf)
     early = callbacks.EarlyStopping(
         monitor='val_accuracy',
         mode='max',
@@ -99,8 +413,8 @@ def main():
         model.fit(
             train_ds,
             validation_data=val_ds,
-            epochs=EPOCHS,
-            callbacks=[early]
+            epochs=args.epochs,
+            callbacks=[early, timer]
         )
     except KeyboardInterrupt:
         print(RED + "\nInterrupted! Evaluating current state..." + RESET)
@@ -109,12 +423,15 @@ def main():
     print(GREEN + f"Final Validation Accuracy: {val_acc*100:.2f}%" + RESET)
 
     print(CYAN + "\nSAVING MODEL:" + RESET)
-    save_learnings(model, class_names)
+    masked = args.mask or is_pack(args.dir) and read_meta(args.dir)["mask"]
+    save_learnings(model, class_names, masked)
+    if args.export:
+        export_learnings(model, val_ds, args.int8)
 
 
 if __name__ == "__main__":
-    import tensorflow as tf
-    from keras import models, layers, callbacks
+    if FLAG in sys.argv:
+        exit(profile_startup())
     try:
         main()
     except Exception as e: